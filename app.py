@@ -5,34 +5,125 @@ Upload questionnaire CSV files and generate detailed user personas.
 """
 
 import streamlit as st
-import pandas as pd
 import io
+import os
+import logging
 import sys
-import base64
+import hashlib
 from pathlib import Path
 from datetime import datetime
 
 # Add current directory to path to import persona_generator
 sys.path.insert(0, str(Path(__file__).parent))
 
-# Load fonts as base64
-def load_font_base64(font_path):
-    """Load font file and return as base64 string"""
-    font_file = Path(__file__).parent / font_path
-    if font_file.exists():
-        with open(font_file, 'rb') as f:
-            return base64.b64encode(f.read()).decode('utf-8')
-    return None
-
-# Load fonts
-font_regular_b64 = load_font_base64('fonts/SuisseIntl-Regular.woff2')
-font_bold_b64 = load_font_base64('fonts/SuisseIntl-Bold.woff2')
-
-from persona_generator import (
-    QuestionnaireParser,
-    GeminiPersonaGenerator,
-    PersonaCSVExporter
-)
+# Tracebacks go to the server log; the UI only shows them when debugging
+logger = logging.getLogger(__name__)
+
+# Maximum number of leading bytes searched for the CSV header row
+HEADER_SCAN_BYTES = 64 * 1024
+
+# Locate the CSV header row (skip metadata rows before it)
+def find_header_offset(head):
+    """Return the byte offset of the Question/Answer header row, or 0 if there is none"""
+    # Check for both formats:
+    # 1. Full format: Section, Question, Answer
+    # 2. Simple format: Question, Answer (or question, answer)
+    head_upper = head.upper()
+    idx = head_upper.find(b'QUESTION')
+    while idx != -1:
+        line_start = head_upper.rfind(b'\n', 0, idx) + 1
+        line_end = head_upper.find(b'\n', idx)
+        if line_end == -1:
+            line_end = len(head_upper)
+        
+        # Validate that these are column headers (not part of other words like "Questionnaire")
+        parts = [p.strip() for p in head_upper[line_start:line_end].split(b',')]
+        if b'QUESTION' in parts and b'ANSWER' in parts:
+            return line_start
+        idx = head_upper.find(b'QUESTION', line_end)
+    return 0
+
+# Read questionnaire CSV (pyarrow engine when the file allows it)
+def read_questionnaire_csv(f):
+    """Read questionnaire rows as raw strings from a binary file positioned at the CSV header row"""
+    # pandas is imported on first upload to keep cold starts fast
+    import pandas as pd
+    start = f.tell()
+    try:
+        # Cells stay verbatim strings (no numeric or "N/A"/"None" inference) so the parser can reuse the table
+        return pd.read_csv(f, engine='pyarrow', dtype_backend='pyarrow', dtype=str, keep_default_na=False)
+    except ImportError:
+        # pyarrow is optional - the C parser reads every file it can
+        pass
+    except ValueError:
+        # pyarrow rejects ragged rows (e.g. trailing empty cells) and undecodable bytes - the C parser replaces those
+        pass
+    f.seek(start)
+    return pd.read_csv(f, encoding='utf-8-sig', encoding_errors='replace', index_col=False, low_memory=False,
+                       dtype=str, keep_default_na=False)
+
+# Persona preview formatting
+def inline_list(value):
+    """Join list values with commas, passing single values through"""
+    return ', '.join(value) if type(value) is list else value
+
+def bullet_list(value):
+    """Format a list (or a single value) as markdown bullet points"""
+    items = value if type(value) is list else [value]
+    return "\n".join(f"- {item}" for item in items)
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def load_questionnaire_csv(file_digest, _uploaded_file):
+    """Find the CSV header row and load the questionnaire table (cached per uploaded file digest)"""
+    f = _uploaded_file
+    f.seek(0)
+    header_offset = find_header_offset(f.read(HEADER_SCAN_BYTES))
+    
+    # Read CSV starting from the header row (or from the start for simple CSVs without metadata rows)
+    f.seek(header_offset)
+    return read_questionnaire_csv(f)
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def parse_questionnaire(file_digest, _uploaded_file, section_col, question_col, answer_col):
+    """Parse questionnaire Q&A pairs and metadata (cached per uploaded file digest and column mapping)"""
+    from persona_generator import QuestionnaireParser
+    # Reuse the already loaded table; only the metadata rows above the header are read again
+    buffer = _uploaded_file.getbuffer()
+    header_offset = find_header_offset(bytes(buffer[:HEADER_SCAN_BYTES]))
+    preamble = bytes(buffer[:header_offset]).decode('utf-8-sig', errors='replace')
+    parser = QuestionnaireParser.from_dataframe(
+        load_questionnaire_csv(file_digest, _uploaded_file),
+        client_info=QuestionnaireParser.parse_metadata(preamble.splitlines()),
+        section_col=section_col,
+        question_col=question_col,
+        answer_col=answer_col
+    )
+    return parser.parse()
+
+
+# Sidebar instructions, rendered with a single markdown call
+SIDEBAR_MARKDOWN = """
+### How to use this tool
+
+**Step 1: prepare .csv file**
+
+- If you haven't used other Studio Direction tools already: take the questions and answers from the questionnaire you have (Word, PDF, email, notes, etc.) and paste that content into an AI chat, upload your questionnaire CSV as an example, and use this prompt:
+
+<div class="prompt-box">Could you return this content in a CSV file, where questions are in column A and answers are in column B? Please also add a header row with the column names: "question" and "answer". Use uploaded CSV as an example.</div>
+
+- If you already have output from other Studio Direction tools skip this step.
+
+**Step 2: import data**
+
+- Upload the CSV file here in the app.
+
+**Step 3: download**
+
+- Click on "Generate Personas".
+- Download the generated personas CSV.
+"""
+
 
 # Page config
 st.set_page_config(
@@ -42,176 +133,172 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Custom CSS
-font_face_css = ""
-if font_regular_b64:
-    font_face_css += f"""
-    @font-face {{
-        font-family: 'Suisse Intl';
-        src: url(data:font/woff2;base64,{font_regular_b64}) format('woff2');
-        font-weight: normal;
-        font-style: normal;
-        font-display: swap;
-    }}
-    """
-if font_bold_b64:
-    font_face_css += f"""
-    @font-face {{
-        font-family: 'Suisse Intl';
-        src: url(data:font/woff2;base64,{font_bold_b64}) format('woff2');
-        font-weight: bold;
-        font-style: normal;
-        font-display: swap;
-    }}
-    """
-
-css_content = """
-<style>
-    /* Font faces */
-    """ + font_face_css + """
+# Custom CSS (fonts are served from static/fonts so the browser can cache them)
+CUSTOM_CSS = """
+    <style>
+        /* Font faces */
+        @font-face {
+            font-family: 'Suisse Intl';
+            src: url('app/static/fonts/SuisseIntl-Regular.woff2') format('woff2');
+            font-weight: normal;
+            font-style: normal;
+            font-display: swap;
+        }
+        @font-face {
+            font-family: 'Suisse Intl';
+            src: url('app/static/fonts/SuisseIntl-Bold.woff2') format('woff2');
+            font-weight: bold;
+            font-style: normal;
+            font-display: swap;
+        }
     
-    /* Main background - dark theme */
-    .stApp {
-        background-color: #080808;
-        color: #f5f5f7;
-        font-family: 'Suisse Intl', -apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif;
-    }
+        /* Main background - dark theme */
+        .stApp {
+            background-color: #080808;
+            color: #f5f5f7;
+            font-family: 'Suisse Intl', -apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif;
+        }
     
-    /* Main content area */
-    .main .block-container {
-        background-color: #080808;
-        color: #f5f5f7;
-    }
+        /* Main content area */
+        .main .block-container {
+            background-color: #080808;
+            color: #f5f5f7;
+        }
     
-    /* Headers */
-    .main-header {
-        font-family: 'Suisse Intl', -apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif;
-        font-size: 3rem;
-        font-weight: bold;
-        color: #f5f5f7;
-        text-align: center;
-        margin-bottom: 1rem;
-    }
-    .sub-header {
-        font-family: 'Suisse Intl', -apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif;
-        font-size: 1.2rem;
-        font-weight: normal;
-        color: rgba(245, 245, 247, 0.7);
-        text-align: center;
-        margin-bottom: 2rem;
-    }
+        /* Headers */
+        .main-header {
+            font-family: 'Suisse Intl', -apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif;
+            font-size: 3rem;
+            font-weight: bold;
+            color: #f5f5f7;
+            text-align: center;
+            margin-bottom: 1rem;
+        }
+        .sub-header {
+            font-family: 'Suisse Intl', -apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif;
+            font-size: 1.2rem;
+            font-weight: normal;
+            color: rgba(245, 245, 247, 0.7);
+            text-align: center;
+            margin-bottom: 2rem;
+        }
     
-    /* Buttons - white */
-    .stButton>button {
-        font-family: 'Suisse Intl', -apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif;
-        width: 100%;
-        background-color: #f5f5f7;
-        color: #080808;
-        font-weight: bold;
-        padding: 0.5rem 1rem;
-        border-radius: 0.5rem;
-        border: none;
-    }
-    .stButton>button:hover {
-        background-color: rgba(245, 245, 247, 0.9);
-    }
+        /* Buttons - white */
+        .stButton>button {
+            font-family: 'Suisse Intl', -apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif;
+            width: 100%;
+            background-color: #f5f5f7;
+            color: #080808;
+            font-weight: bold;
+            padding: 0.5rem 1rem;
+            border-radius: 0.5rem;
+            border: none;
+        }
+        .stButton>button:hover {
+            background-color: rgba(245, 245, 247, 0.9);
+        }
     
-    /* Prompt box */
-    .prompt-box {
-        border: 1px solid rgba(245, 245, 247, 0.15);
-        border-left: 4px solid #f5f5f7;
-        border-radius: 4px;
-        padding: 1rem;
-        margin: 0.5rem 0;
-        font-family: 'Courier New', monospace;
-        font-size: 0.9rem;
-        white-space: pre-wrap;
-        position: relative;
-        background-color: rgba(245, 245, 247, 0.03);
-        color: #f5f5f7;
-    }
+        /* Prompt box */
+        .prompt-box {
+            border: 1px solid rgba(245, 245, 247, 0.15);
+            border-left: 4px solid #f5f5f7;
+            border-radius: 4px;
+            padding: 1rem;
+            margin: 0.5rem 0;
+            font-family: 'Courier New', monospace;
+            font-size: 0.9rem;
+            white-space: pre-wrap;
+            position: relative;
+            background-color: rgba(245, 245, 247, 0.03);
+            color: #f5f5f7;
+        }
     
-    /* Sidebar - different shade to separate from main background */
-    section[data-testid="stSidebar"] {
-        width: 380px !important;
-        background-color: #0f0f0f;
-        border-right: 1px solid rgba(245, 245, 247, 0.1);
-    }
+        /* Sidebar - different shade to separate from main background */
+        section[data-testid="stSidebar"] {
+            width: 380px !important;
+            background-color: #0f0f0f;
+            border-right: 1px solid rgba(245, 245, 247, 0.1);
+        }
     
-    /* Sidebar text */
-    section[data-testid="stSidebar"] .stMarkdown,
-    section[data-testid="stSidebar"] h3,
-    section[data-testid="stSidebar"] p,
-    section[data-testid="stSidebar"] li,
-    section[data-testid="stSidebar"] strong {
-        color: #f5f5f7 !important;
-    }
+        /* Sidebar text */
+        section[data-testid="stSidebar"] .stMarkdown,
+        section[data-testid="stSidebar"] h3,
+        section[data-testid="stSidebar"] p,
+        section[data-testid="stSidebar"] li,
+        section[data-testid="stSidebar"] strong {
+            color: #f5f5f7 !important;
+        }
     
-    /* Dividers and borders */
-    hr {
-        border-color: rgba(245, 245, 247, 0.1);
-    }
+        /* Dividers and borders */
+        hr {
+            border-color: rgba(245, 245, 247, 0.1);
+        }
     
-    /* Main text color */
-    .stMarkdown, p, li {
-        font-family: 'Suisse Intl', -apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif;
-        font-weight: normal;
-        color: #f5f5f7;
-    }
+        /* Main text color */
+        .stMarkdown, p, li {
+            font-family: 'Suisse Intl', -apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif;
+            font-weight: normal;
+            color: #f5f5f7;
+        }
     
-    /* Headings - bold */
-    h1, h2, h3, h4, h5, h6, strong {
-        font-family: 'Suisse Intl', -apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif;
-        font-weight: bold;
-        color: #f5f5f7;
-    }
+        /* Headings - bold */
+        h1, h2, h3, h4, h5, h6, strong {
+            font-family: 'Suisse Intl', -apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif;
+            font-weight: bold;
+            color: #f5f5f7;
+        }
     
-    /* Success and info boxes */
-    .success-box {
-        padding: 1rem;
-        border-radius: 0.5rem;
-        background-color: rgba(245, 245, 247, 0.05);
-        border: 1px solid rgba(245, 245, 247, 0.15);
-        color: #f5f5f7;
-        margin: 1rem 0;
-    }
-    .info-box {
-        padding: 1rem;
-        border-radius: 0.5rem;
-        background-color: rgba(245, 245, 247, 0.05);
-        border: 1px solid rgba(245, 245, 247, 0.15);
-        color: #f5f5f7;
-        margin: 1rem 0;
-    }
+        /* Success and info boxes */
+        .success-box {
+            padding: 1rem;
+            border-radius: 0.5rem;
+            background-color: rgba(245, 245, 247, 0.05);
+            border: 1px solid rgba(245, 245, 247, 0.15);
+            color: #f5f5f7;
+            margin: 1rem 0;
+        }
+        .info-box {
+            padding: 1rem;
+            border-radius: 0.5rem;
+            background-color: rgba(245, 245, 247, 0.05);
+            border: 1px solid rgba(245, 245, 247, 0.15);
+            color: #f5f5f7;
+            margin: 1rem 0;
+        }
     
-    /* Streamlit default elements */
-    .stSuccess {
-        background-color: rgba(245, 245, 247, 0.05);
-        border-color: rgba(245, 245, 247, 0.15);
-        color: #f5f5f7;
-    }
+        /* Streamlit default elements */
+        .stSuccess {
+            background-color: rgba(245, 245, 247, 0.05);
+            border-color: rgba(245, 245, 247, 0.15);
+            color: #f5f5f7;
+        }
     
-    .stInfo {
-        background-color: rgba(245, 245, 247, 0.05);
-        border-color: rgba(245, 245, 247, 0.15);
-        color: #f5f5f7;
-    }
+        .stInfo {
+            background-color: rgba(245, 245, 247, 0.05);
+            border-color: rgba(245, 245, 247, 0.15);
+            color: #f5f5f7;
+        }
     
-    .stWarning {
-        background-color: rgba(245, 245, 247, 0.05);
-        border-color: rgba(245, 245, 247, 0.15);
-        color: #f5f5f7;
-    }
+        .stWarning {
+            background-color: rgba(245, 245, 247, 0.05);
+            border-color: rgba(245, 245, 247, 0.15);
+            color: #f5f5f7;
+        }
     
-    /* Header - remove default background */
-    .stAppHeader {
-        background-color: #080808 !important;
-        border-bottom: 1px solid rgba(245, 245, 247, 0.1);
-    }
-</style>
-"""
+        /* Header - remove default background */
+        .stAppHeader {
+            background-color: #080808 !important;
+            border-bottom: 1px solid rgba(245, 245, 247, 0.1);
+        }
+    </style>
+    """
 
-st.markdown(css_content, unsafe_allow_html=True)
+# Page header, sent together with the CSS in a single markdown element
+HEADER_HTML = (
+    '<div class="main-header">👤 User Persona Generator</div>'
+    '<div class="sub-header">Generate user personas from the Discovery questionnaire.</div>'
+)
+st.markdown(CUSTOM_CSS + HEADER_HTML, unsafe_allow_html=True)
 
 # Initialize session state
 if 'personas_generated' not in st.session_state:
@@ -222,6 +309,8 @@ if 'client_info' not in st.session_state:
     st.session_state.client_info = None
 if 'csv_data' not in st.session_state:
     st.session_state.csv_data = None
+if 'personas_df' not in st.session_state:
+    st.session_state.personas_df = None
 if 'csv_columns' not in st.session_state:
     st.session_state.csv_columns = []
 if 'csv_df' not in st.session_state:
@@ -231,70 +320,31 @@ if 'selected_columns' not in st.session_state:
 if 'switch_to_results' not in st.session_state:
     st.session_state.switch_to_results = False
 
-# Header
-st.markdown('<div class="main-header">👤 User Persona Generator</div>', unsafe_allow_html=True)
-st.markdown('<div class="sub-header">Generate user personas from the Discovery questionnaire.</div>', unsafe_allow_html=True)
-
 # Sidebar
 with st.sidebar:
-    st.markdown("### How to use this tool")
-    
-    st.markdown("**Step 1: prepare .csv file**")
-    st.markdown("""
-    - If you haven't used other Studio Direction tools already: take the questions and answers from the questionnaire you have (Word, PDF, email, notes, etc.) and paste that content into an AI chat, upload your questionnaire CSV as an example, and use this prompt:
-    """)
-    st.markdown("""
-    <div class="prompt-box">Could you return this content in a CSV file, where questions are in column A and answers are in column B? Please also add a header row with the column names: "question" and "answer". Use uploaded CSV as an example.</div>
-    """, unsafe_allow_html=True)
-    st.markdown("""
-    - If you already have output from other Studio Direction tools skip this step.
-    """)
-    
-    st.markdown("**Step 2: import data**")
-    st.markdown("""
-    - Upload the CSV file here in the app.
-    """)
-    
-    st.markdown("**Step 3: download**")
-    st.markdown("""
-    - Click on "Generate Personas".
-    - Download the generated personas CSV.
-    """)
+    st.markdown(SIDEBAR_MARKDOWN, unsafe_allow_html=True)
 
-# Load API key from .env file
-import os
-from dotenv import load_dotenv
-load_dotenv()
-api_key = os.getenv('GEMINI_API_KEY', '')
+# Load API key from .env file (once per process instead of on every rerun)
+@st.cache_resource(show_spinner=False)
+def load_api_key():
+    """Load the .env file and return the Gemini API key"""
+    from dotenv import load_dotenv
+    load_dotenv()
+    return os.getenv('GEMINI_API_KEY', '')
+
+api_key = load_api_key()
+# Full tracebacks are only rendered in the UI when debugging
+debug = bool(os.getenv('STREAMLIT_DEBUG'))
 
 # Main content
-tab1, tab2, tab3 = st.tabs(["📤 Upload & Generate", "📊 Preview Results", "📥 Download"])
+TAB_LABELS = ["📤 Upload & Generate", "📊 Preview Results", "📥 Download"]
 
-# Auto-switch to results tab if personas were just generated
+# Switch to the results tab if personas were just generated (must happen before the tabs are created)
 if st.session_state.get('switch_to_results', False):
     st.session_state.switch_to_results = False  # Reset flag
-    # Inject JavaScript to click on tab2 after page loads
-    st.markdown("""
-    <script>
-    setTimeout(function() {
-        try {
-            // Try multiple selectors for Streamlit tabs
-            var tabs = window.parent.document.querySelectorAll('button[data-baseweb="tab"]');
-            if (tabs && tabs.length > 1) {
-                tabs[1].click();
-                return;
-            }
-            // Alternative selector
-            tabs = window.parent.document.querySelectorAll('[role="tablist"] button');
-            if (tabs && tabs.length > 1) {
-                tabs[1].click();
-            }
-        } catch(e) {
-            console.log('Tab switching error:', e);
-        }
-    }, 500);
-    </script>
-    """, unsafe_allow_html=True)
+    st.session_state.active_tab = TAB_LABELS[1]
+
+tab1, tab2, tab3 = st.tabs(TAB_LABELS, key='active_tab', on_change='rerun')
 
 with tab1:
     st.header("Import data")
@@ -305,47 +355,11 @@ with tab1:
     )
     
     if uploaded_file is not None:
-        # Save uploaded file temporarily
-        file_path = f"/tmp/{uploaded_file.name}"
-        with open(file_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
+        # Work on the in-memory upload directly - no temp file round-trip
+        file_digest = hashlib.sha1(uploaded_file.getbuffer()).hexdigest()
         
-        # Find where CSV headers start (skip metadata rows)
         try:
-            header_row_index = None
-            df = None
-            
-            with open(file_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-                for i, line in enumerate(lines):
-                    line_upper = line.upper()
-                    # Check for both formats:
-                    # 1. Full format: Section, Question, Answer
-                    # 2. Simple format: Question, Answer (or question, answer)
-                    has_question = 'QUESTION' in line_upper
-                    has_answer = 'ANSWER' in line_upper
-                    
-                    # Must have both question and answer columns
-                    if has_question and has_answer and ',' in line:
-                        # Validate that these are column headers (not part of other words)
-                        parts = [p.strip().upper() for p in line.split(',')]
-                        question_col_found = any(p == 'QUESTION' for p in parts)
-                        answer_col_found = any(p == 'ANSWER' for p in parts)
-                        
-                        if question_col_found and answer_col_found:
-                            header_row_index = i
-                            break
-            
-            # Read CSV file
-            if header_row_index is not None:
-                # Read CSV starting from header row (if header_row_index > 0, skip rows before it)
-                if header_row_index > 0:
-                    df = pd.read_csv(file_path, encoding='utf-8', skiprows=range(header_row_index))
-                else:
-                    df = pd.read_csv(file_path, encoding='utf-8')
-            else:
-                # Try reading from the start (maybe it's a simple CSV without metadata rows)
-                df = pd.read_csv(file_path, encoding='utf-8')
+            df = load_questionnaire_csv(file_digest, uploaded_file)
             
             # Validate that CSV has question/answer columns (case-insensitive)
             col_names_lower = [col.lower().strip() for col in df.columns]
@@ -379,13 +393,13 @@ with tab1:
                 if question_col and answer_col:
                     with st.spinner("📋 Parsing questionnaire..."):
                         try:
-                            parser = QuestionnaireParser(
-                                file_path,
+                            questionnaire_data = parse_questionnaire(
+                                file_digest,
+                                uploaded_file,
                                 section_col=section_col,
                                 question_col=question_col,
                                 answer_col=answer_col
                             )
-                            questionnaire_data = parser.parse()
                             
                             st.session_state.client_info = questionnaire_data['client_info']
                             
@@ -393,14 +407,18 @@ with tab1:
                             st.session_state.questionnaire_data = questionnaire_data
                             
                         except Exception as e:
+                            logger.exception("Error parsing questionnaire")
                             st.error(f"❌ Error parsing questionnaire: {str(e)}")
-                            st.exception(e)
+                            if debug:
+                                st.exception(e)
                 else:
                     st.error("❌ Could not find 'question' and 'answer' columns in CSV file. Please ensure your CSV has these columns.")
         
         except Exception as e:
+            logger.exception("Error reading CSV file")
             st.error(f"❌ Error reading CSV file: {str(e)}")
-            st.exception(e)
+            if debug:
+                st.exception(e)
         
         # Generate personas section (only show if parsed successfully)
         if 'questionnaire_data' in st.session_state and st.session_state.questionnaire_data:
@@ -413,73 +431,38 @@ with tab1:
                 if st.button(button_text, type="primary", use_container_width=False):
                     with st.spinner("🤖 Generating personas using Gemini AI... This may take 30-60 seconds..."):
                             try:
+                                # Deferred so the Gemini SDK and pandas only load once personas are requested
+                                import pandas as pd
+                                from persona_generator import (
+                                    GeminiPersonaGenerator,
+                                    PersonaCSVExporter,
+                                    PERSONA_CSV_COLUMNS,
+                                    flatten_persona
+                                )
                                 generator = GeminiPersonaGenerator(api_key=api_key)
-                                personas = generator.generate_personas(questionnaire_data)
+                                # One request per persona type, sent concurrently (input tokens roughly x3)
+                                personas = generator.generate_personas_concurrent(questionnaire_data)
                                 
                                 if personas and len(personas) > 0:
                                     st.session_state.personas_generated = True
                                     st.session_state.personas_data = personas
                                     st.session_state.client_info = questionnaire_data['client_info']
                                     
-                                    # Create CSV in memory
+                                    client_info = questionnaire_data['client_info']
+                                    rows = [flatten_persona(persona, client_info) for persona in personas]
+                                    
+                                    # Create CSV in memory, encoded once so the download button can reuse the bytes
                                     csv_buffer = io.StringIO()
                                     exporter = PersonaCSVExporter("")
+                                    exporter.write(csv_buffer, rows)
+                                    st.session_state.csv_data = csv_buffer.getvalue().encode('utf-8')
                                     
-                                    # Convert to DataFrame for preview and download
-                                    rows = []
-                                    for persona in personas:
-                                        base_row = {
-                                            'Client Name': questionnaire_data['client_info'].get('Client Name', ''),
-                                            'Product Name': questionnaire_data['client_info'].get('Product Name', ''),
-                                            'Persona Name': persona.get('persona_name', ''),
-                                            'Persona Type': persona.get('persona_type', ''),
-                                        }
-                                        
-                                        demo = persona.get('demographics', {})
-                                        base_row.update({
-                                            'Age Range': demo.get('age_range', ''),
-                                            'Gender': demo.get('gender', ''),
-                                            'Location': demo.get('location', ''),
-                                            'Income Level': demo.get('income_level', ''),
-                                            'Net Worth': demo.get('net_worth', ''),
-                                            'Education': demo.get('education', ''),
-                                            'Occupation': demo.get('occupation', ''),
-                                            'Family Status': demo.get('family_status', ''),
-                                        })
-                                        
-                                        psycho = persona.get('psychographics', {})
-                                        base_row.update({
-                                            'Values': '; '.join(psycho.get('values', [])) if isinstance(psycho.get('values'), list) else psycho.get('values', ''),
-                                            'Motivations': '; '.join(psycho.get('motivations', [])) if isinstance(psycho.get('motivations'), list) else psycho.get('motivations', ''),
-                                            'Lifestyle': psycho.get('lifestyle', ''),
-                                            'Interests': '; '.join(psycho.get('interests', [])) if isinstance(psycho.get('interests'), list) else psycho.get('interests', ''),
-                                        })
-                                        
-                                        base_row.update({
-                                            'Goals': '; '.join(persona.get('goals', [])) if isinstance(persona.get('goals'), list) else persona.get('goals', ''),
-                                            'Challenges': '; '.join(persona.get('challenges', [])) if isinstance(persona.get('challenges'), list) else persona.get('challenges', ''),
-                                            'Needs': '; '.join(persona.get('needs', [])) if isinstance(persona.get('needs'), list) else persona.get('needs', ''),
-                                            'Pain Points': '; '.join(persona.get('pain_points', [])) if isinstance(persona.get('pain_points'), list) else persona.get('pain_points', ''),
-                                        })
-                                        
-                                        behavior = persona.get('behavior', {})
-                                        base_row.update({
-                                            'Research Style': behavior.get('research_style', ''),
-                                            'Decision Making': behavior.get('decision_making', ''),
-                                            'Communication Preferences': behavior.get('communication_preferences', ''),
-                                            'Online Behavior': behavior.get('online_behavior', ''),
-                                        })
-                                        
-                                        base_row.update({
-                                            'Quote': persona.get('quote', ''),
-                                            'Key Characteristics': '; '.join(persona.get('key_characteristics', [])) if isinstance(persona.get('key_characteristics'), list) else persona.get('key_characteristics', ''),
-                                        })
-                                        
-                                        rows.append(base_row)
-                                    
-                                    df = pd.DataFrame(rows)
-                                    csv_string = df.to_csv(index=False)
-                                    st.session_state.csv_data = csv_string
+                                    # Keep the table for the Download tab preview (built column-wise from the rows)
+                                    personas_df = pd.DataFrame(dict(zip(PERSONA_CSV_COLUMNS, map(list, zip(*rows)))))
+                                    # Only these columns repeat across personas - the rest is free text that a category wouldn't shrink
+                                    st.session_state.personas_df = personas_df.astype(
+                                        {'Client Name': 'category', 'Product Name': 'category', 'Persona Type': 'category'}
+                                    )
                                     
                                     st.success(f"✅ Successfully generated {len(personas)} persona(s)!")
                                     st.balloons()
@@ -491,6 +474,7 @@ with tab1:
                                     st.info("💡 **Tips:**\n- Check if your Gemini API key is valid\n- Verify you have API quota available\n- Try again in a few moments if you hit rate limits")
                                     
                             except Exception as e:
+                                logger.exception("Error generating personas")
                                 error_msg = str(e).lower()
                                 if 'rate limit' in error_msg or 'quota' in error_msg:
                                     st.error("❌ **Rate Limit Exceeded**: The API rate limit has been reached. Please wait a few minutes and try again.")
@@ -501,7 +485,8 @@ with tab1:
                                 else:
                                     st.error(f"❌ **Error generating personas**: {str(e)}")
                                 
-                                st.exception(e)
+                                if debug:
+                                    st.exception(e)
                                 st.info("💡 If this error persists, please check the logs for more details.")
             else:
                 st.warning("⚠️ Please provide Gemini API key in the sidebar to generate personas.")
@@ -514,65 +499,40 @@ with tab2:
         
         st.success(f"✅ {len(personas)} persona(s) generated successfully!")
         
-        # Display each persona
-        for idx, persona in enumerate(personas, 1):
-            with st.expander(f"👤 {persona.get('persona_name', f'Persona {idx}')} - {persona.get('persona_type', 'N/A')}", expanded=(idx == 1)):
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    st.markdown("### 📊 Demographics")
-                    demo = persona.get('demographics', {})
-                    st.markdown(f"- **Age:** {demo.get('age_range', 'N/A')}")
-                    st.markdown(f"- **Gender:** {demo.get('gender', 'N/A')}")
-                    st.markdown(f"- **Location:** {demo.get('location', 'N/A')}")
-                    st.markdown(f"- **Income:** {demo.get('income_level', 'N/A')}")
-                    st.markdown(f"- **Net Worth:** {demo.get('net_worth', 'N/A')}")
-                    st.markdown(f"- **Education:** {demo.get('education', 'N/A')}")
-                    st.markdown(f"- **Occupation:** {demo.get('occupation', 'N/A')}")
-                    st.markdown(f"- **Family:** {demo.get('family_status', 'N/A')}")
+        # Display each persona (only built while this tab is open)
+        if tab2.open:
+            for idx, persona in enumerate(personas, 1):
+                with st.expander(f"👤 {persona.get('persona_name', f'Persona {idx}')} - {persona.get('persona_type', 'N/A')}", expanded=(idx == 1)):
+                    col1, col2 = st.columns(2)
                 
-                with col2:
-                    st.markdown("### 🧠 Psychographics")
-                    psycho = persona.get('psychographics', {})
-                    st.markdown(f"- **Values:** {', '.join(psycho.get('values', [])) if isinstance(psycho.get('values'), list) else psycho.get('values', 'N/A')}")
-                    st.markdown(f"- **Lifestyle:** {psycho.get('lifestyle', 'N/A')}")
-                    st.markdown(f"- **Interests:** {', '.join(psycho.get('interests', [])) if isinstance(psycho.get('interests'), list) else psycho.get('interests', 'N/A')}")
+                    with col1:
+                        demo = persona.get('demographics') or {}
+                        st.markdown("\n".join([
+                            "### 📊 Demographics",
+                            f"- **Age:** {demo.get('age_range', 'N/A')}",
+                            f"- **Gender:** {demo.get('gender', 'N/A')}",
+                            f"- **Location:** {demo.get('location', 'N/A')}",
+                            f"- **Income:** {demo.get('income_level', 'N/A')}",
+                            f"- **Net Worth:** {demo.get('net_worth', 'N/A')}",
+                            f"- **Education:** {demo.get('education', 'N/A')}",
+                            f"- **Occupation:** {demo.get('occupation', 'N/A')}",
+                            f"- **Family:** {demo.get('family_status', 'N/A')}",
+                        ]))
                 
-                st.markdown("### 🎯 Goals")
-                goals = persona.get('goals', [])
-                if isinstance(goals, list):
-                    for goal in goals:
-                        st.markdown(f"- {goal}")
-                else:
-                    st.markdown(f"- {goals}")
-                
-                st.markdown("### ⚠️ Challenges")
-                challenges = persona.get('challenges', [])
-                if isinstance(challenges, list):
-                    for challenge in challenges:
-                        st.markdown(f"- {challenge}")
-                else:
-                    st.markdown(f"- {challenges}")
+                    with col2:
+                        psycho = persona.get('psychographics') or {}
+                        st.markdown("\n".join([
+                            "### 🧠 Psychographics",
+                            f"- **Values:** {inline_list(psycho.get('values', 'N/A'))}",
+                            f"- **Lifestyle:** {psycho.get('lifestyle', 'N/A')}",
+                            f"- **Interests:** {inline_list(psycho.get('interests', 'N/A'))}",
+                        ]))
                 
-                st.markdown("### 💡 Needs")
-                needs = persona.get('needs', [])
-                if isinstance(needs, list):
-                    for need in needs:
-                        st.markdown(f"- {need}")
-                else:
-                    st.markdown(f"- {needs}")
-                
-                st.markdown("### 💬 Quote")
-                quote = persona.get('quote', 'N/A')
-                st.markdown(f"> {quote}")
-                
-                st.markdown("### ✨ Key Characteristics")
-                characteristics = persona.get('key_characteristics', [])
-                if isinstance(characteristics, list):
-                    for char in characteristics:
-                        st.markdown(f"- {char}")
-                else:
-                    st.markdown(f"- {characteristics}")
+                    st.markdown("### 🎯 Goals\n" + bullet_list(persona.get('goals', [])))
+                    st.markdown("### ⚠️ Challenges\n" + bullet_list(persona.get('challenges', [])))
+                    st.markdown("### 💡 Needs\n" + bullet_list(persona.get('needs', [])))
+                    st.markdown(f"### 💬 Quote\n> {persona.get('quote', 'N/A')}")
+                    st.markdown("### ✨ Key Characteristics\n" + bullet_list(persona.get('key_characteristics', [])))
     else:
         st.info("👆 Upload a questionnaire CSV and generate personas to see preview here.")
 
@@ -597,9 +557,9 @@ with tab3:
         
         st.markdown("---")
         
-        # Show preview as table
-        df = pd.read_csv(io.StringIO(st.session_state.csv_data))
-        st.dataframe(df, width='stretch')
+        # Show preview as table (only serialized while this tab is open)
+        if tab3.open:
+            st.dataframe(st.session_state.personas_df, width='stretch')
     else:
         st.info("👆 Generate personas first to download the CSV file.")
 
@@ -4,288 +4,127 @@ User Persona Generator Tool
 Analyzes questionnaire CSV files using Gemini 2.5 Flash to generate comprehensive user personas.
 """
 
+import asyncio
+import contextlib
 import csv
+import functools
+import hashlib
+import itertools
 import json
 import os
-import re
+import random
 import sys
+import tempfile
+import threading
 import time
+from collections import OrderedDict
+from operator import itemgetter
 from pathlib import Path
-from typing import Dict, List, Optional
-import google.generativeai as genai
-from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 
-# Try to load .env file if dotenv is available
-try:
-    from dotenv import load_dotenv
+
+def _load_dotenv() -> None:
+    """Try to load .env file if dotenv is available."""
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        return
     load_dotenv()
+
+
+# Use orjson for decoding Gemini responses if available (its JSONDecodeError subclasses json's)
+try:
+    import orjson
+    _json_loads = orjson.loads
 except ImportError:
-    pass
+    _json_loads = json.loads
 
 
-class QuestionnaireParser:
-    """Parses questionnaire CSV files and extracts relevant information."""
-    
-    def __init__(self, csv_path: str, section_col: str = 'Section', question_col: str = 'Question', answer_col: str = 'Answer'):
-        self.csv_path = csv_path
-        self.client_info = {}
-        self.questions_answers = []
-        self.persona_section = []
-        self.section_col = section_col
-        self.question_col = question_col
-        self.answer_col = answer_col
-        
-    def parse(self) -> Dict:
-        """Parse the CSV file and extract structured data."""
-        import io
-        
-        with open(self.csv_path, 'r', encoding='utf-8') as f:
-            # Read all lines first
-            all_lines = f.readlines()
-            
-            # Extract metadata from first few rows (before CSV headers)
-            header_row_index = None
-            for i, line in enumerate(all_lines):
-                # Look for the header row - must contain both QUESTION and ANSWER (exact column names)
-                line_upper = line.upper()
-                # Check if line contains both "QUESTION" and "ANSWER" as separate words/columns
-                has_question = (self.question_col and self.question_col.upper() in line_upper) or 'QUESTION' in line_upper
-                has_answer = (self.answer_col and self.answer_col.upper() in line_upper) or 'ANSWER' in line_upper
-                
-                # Must have both QUESTION and ANSWER, and avoid false positives like "QUESTIONNAIRE"
-                if has_question and has_answer:
-                    # Double check - make sure it's not just "QUESTIONNAIRE TYPE" or similar
-                    if ',' in line:  # Should be a CSV line with columns
-                        parts = [p.strip().upper() for p in line.split(',')]
-                        # Check if QUESTION and ANSWER are actual column headers (not part of other words)
-                        if any('QUESTION' == p or (self.question_col and self.question_col.upper() == p) for p in parts) and \
-                           any('ANSWER' == p or (self.answer_col and self.answer_col.upper() == p) for p in parts):
-                            header_row_index = i
-                            break
-                
-                # Extract metadata from rows before headers
-                if ',' in line and header_row_index is None:
-                    parts = line.strip().split(',', 1)
-                    if len(parts) == 2:
-                        key, value = parts
-                        self.client_info[key.strip()] = value.strip()
-            
-            if header_row_index is None:
-                # If no header found, try reading from start
-                header_row_index = 0
-            
-            # Create CSV content starting from header row
-            csv_content = ''.join(all_lines[header_row_index:])
-            
-            # Read questions and answers using DictReader
-            reader = csv.DictReader(io.StringIO(csv_content))
-            
-            # Debug: Get available column names
-            available_columns = reader.fieldnames if reader.fieldnames else []
-            
-            # Map column names to actual CSV column names (case-insensitive)
-            section_col_name = None
-            question_col_name = None
-            answer_col_name = None
-            
-            for col in available_columns:
-                if col:
-                    col_lower = col.strip().lower()
-                    if self.section_col and col_lower == self.section_col.lower():
-                        section_col_name = col
-                    if self.question_col and col_lower == self.question_col.lower():
-                        question_col_name = col
-                    if self.answer_col and col_lower == self.answer_col.lower():
-                        answer_col_name = col
-            
-            for row in reader:
-                # Use mapped column names
-                section = row.get(section_col_name, '').strip() if section_col_name else ''
-                question = row.get(question_col_name, '').strip() if question_col_name else ''
-                answer = row.get(answer_col_name, '').strip() if answer_col_name else ''
-                
-                # Skip empty rows
-                if not question or not answer:
-                    continue
-                
-                # If no section column, use empty string or 'General'
-                if not section:
-                    section = 'General'
-                
-                self.questions_answers.append({
-                    'section': section,
-                    'question': question,
-                    'answer': answer
-                })
-                
-                # Extract persona-related sections
-                if section and ('Persona' in section or 'Audience' in section or 'Customer' in section):
-                    self.persona_section.append({
-                        'section': section,
-                        'question': question,
-                        'answer': answer
-                    })
-        
-        return {
-            'client_info': self.client_info,
-            'all_qa': self.questions_answers,
-            'persona_qa': self.persona_section
-        }
-    
-    def get_columns(self) -> List[str]:
-        """Get list of column names from CSV file."""
-        with open(self.csv_path, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            return list(reader.fieldnames) if reader.fieldnames else []
+# Persona CSV layout: (output column, key path into the persona dict, join list values with '; ')
+PERSONA_CSV_SCHEMA: Tuple[Tuple[str, Tuple[str, ...], bool], ...] = (
+    ('Persona Name', ('persona_name',), False),
+    ('Persona Type', ('persona_type',), False),
+    ('Age Range', ('demographics', 'age_range'), False),
+    ('Gender', ('demographics', 'gender'), False),
+    ('Location', ('demographics', 'location'), False),
+    ('Income Level', ('demographics', 'income_level'), False),
+    ('Net Worth', ('demographics', 'net_worth'), False),
+    ('Education', ('demographics', 'education'), False),
+    ('Occupation', ('demographics', 'occupation'), False),
+    ('Family Status', ('demographics', 'family_status'), False),
+    ('Values', ('psychographics', 'values'), True),
+    ('Motivations', ('psychographics', 'motivations'), True),
+    ('Lifestyle', ('psychographics', 'lifestyle'), False),
+    ('Interests', ('psychographics', 'interests'), True),
+    ('Goals', ('goals',), True),
+    ('Challenges', ('challenges',), True),
+    ('Needs', ('needs',), True),
+    ('Pain Points', ('pain_points',), True),
+    ('Research Style', ('behavior', 'research_style'), False),
+    ('Decision Making', ('behavior', 'decision_making'), False),
+    ('Communication Preferences', ('behavior', 'communication_preferences'), False),
+    ('Online Behavior', ('behavior', 'online_behavior'), False),
+    ('Quote', ('quote',), False),
+    ('Key Characteristics', ('key_characteristics',), True),
+)
 
+PERSONA_CSV_COLUMNS: Tuple[str, ...] = ('Client Name', 'Product Name') + tuple(col for col, _, _ in PERSONA_CSV_SCHEMA)
 
-class GeminiPersonaGenerator:
-    """Uses Gemini 2.5 Flash to generate user personas from questionnaire data."""
+# Persona types requested separately when generating concurrently
+PERSONA_TYPES: Tuple[str, ...] = ('Primary', 'Secondary', 'Tertiary')
+
+# What each persona type stands for, so separately requested personas cover distinct segments
+PERSONA_TYPE_ROLES: Dict[str, str] = {
+    'Primary': 'the core audience the product is mainly built for',
+    'Secondary': 'an important audience distinct from the core one',
+    'Tertiary': 'a smaller or adjacent audience that still uses or influences the product',
+}
+
+
+def _persona_response_schema() -> Dict:
+    """Gemini response schema for {"personas": [...]}, with persona fields taken from PERSONA_CSV_SCHEMA."""
+    persona = {'type': 'OBJECT', 'properties': {}}
+    for _, path, is_list in PERSONA_CSV_SCHEMA:
+        parent = persona
+        for key in path[:-1]:
+            parent = parent['properties'].setdefault(key, {'type': 'OBJECT', 'properties': {}})
+        parent['properties'][path[-1]] = {'type': 'ARRAY', 'items': {'type': 'STRING'}} if is_list else {'type': 'STRING'}
     
-    def __init__(self, api_key: Optional[str] = None):
-        if api_key is None:
-            api_key = os.getenv('GEMINI_API_KEY')
-            if not api_key:
-                raise ValueError(
-                    "GEMINI_API_KEY environment variable not set. "
-                    "Please set it or pass api_key parameter."
-                )
-        
-        genai.configure(api_key=api_key)
-        # Using Gemini 2.5 Flash model
-        model_name = os.getenv('GEMINI_MODEL', 'gemini-2.5-flash')
-        self.model = genai.GenerativeModel(model_name)
+    # Every field is asked for in the prompt, so require all of them at each level
+    def require_all(schema: Dict) -> Dict:
+        for child in schema['properties'].values():
+            if child['type'] == 'OBJECT':
+                require_all(child)
+        schema['required'] = list(schema['properties'])
+        return schema
     
-    def generate_personas(self, questionnaire_data: Dict, max_retries: int = 3) -> List[Dict]:
-        """Generate comprehensive user personas using Gemini with retry logic."""
-        
-        # Build prompt with all relevant information
-        prompt = self._build_prompt(questionnaire_data)
-        
-        # Retry logic for API calls
-        last_exception = None
-        for attempt in range(max_retries):
-            try:
-                # Generate response with timeout handling
-                generation_config = {
-                    'temperature': 0.7,
-                    'max_output_tokens': 8192,
-                }
-                
-                response = self.model.generate_content(
-                    prompt,
-                    generation_config=generation_config
-                )
-                
-                # Check if response has text
-                if not hasattr(response, 'text') or not response.text:
-                    raise ValueError("Empty response from API")
-                
-                # Parse JSON response
-                try:
-                    # Extract JSON from markdown if present
-                    text = response.text.strip()
-                    
-                    # Try to find JSON in markdown code blocks
-                    if '```json' in text:
-                        text = text.split('```json')[1].split('```')[0].strip()
-                    elif '```' in text:
-                        # Try to extract from any code block
-                        parts = text.split('```')
-                        for i, part in enumerate(parts):
-                            if '{' in part and '[' in part:
-                                text = part.strip()
-                                break
-                    
-                    # Try to find JSON object/array boundaries
-                    if not text.startswith('{') and not text.startswith('['):
-                        # Look for first { or [
-                        start_idx = min(
-                            text.find('{') if '{' in text else len(text),
-                            text.find('[') if '[' in text else len(text)
-                        )
-                        if start_idx < len(text):
-                            text = text[start_idx:]
-                    
-                    # Try to find the end of JSON (might be incomplete)
-                    if text.count('{') > text.count('}'):
-                        # Incomplete JSON - try to close it
-                        text += '}' * (text.count('{') - text.count('}'))
-                    if text.count('[') > text.count(']'):
-                        text += ']' * (text.count('[') - text.count(']'))
-                    
-                    personas_data = json.loads(text)
-                    
-                    # Handle both direct list and wrapped in object
-                    if isinstance(personas_data, list):
-                        return personas_data
-                    elif isinstance(personas_data, dict):
-                        return personas_data.get('personas', [])
-                    else:
-                        raise ValueError(f"Unexpected response format: {type(personas_data)}")
-                        
-                except json.JSONDecodeError as e:
-                    # Log the error for debugging
-                    print(f"JSON parsing error (attempt {attempt + 1}/{max_retries}): {e}")
-                    print(f"Response text (first 500 chars): {response.text[:500]}")
-                    
-                    # If this is the last attempt, try fallback parser
-                    if attempt == max_retries - 1:
-                        return self._parse_text_response(response.text)
-                    # Otherwise, wait and retry
-                    time.sleep(2 ** attempt)  # Exponential backoff
-                    continue
-                    
-            except Exception as e:
-                last_exception = e
-                error_msg = str(e).lower()
-                
-                # Check if it's a retryable error
-                retryable_errors = ['rate limit', 'quota', 'timeout', '503', '429', '500', '502']
-                is_retryable = any(err in error_msg for err in retryable_errors)
-                
-                print(f"API error (attempt {attempt + 1}/{max_retries}): {e}")
-                
-                if attempt < max_retries - 1 and is_retryable:
-                    # Wait before retrying (exponential backoff)
-                    wait_time = 2 ** attempt
-                    print(f"Retrying in {wait_time} seconds...")
-                    time.sleep(wait_time)
-                    continue
-                else:
-                    # Non-retryable error or last attempt
-                    raise Exception(f"Failed to generate personas after {attempt + 1} attempts: {str(e)}")
-        
-        # If we get here, all retries failed
-        if last_exception:
-            raise Exception(f"Failed to generate personas: {str(last_exception)}")
-        raise Exception("Failed to generate personas: Unknown error")
-    
-    def _build_prompt(self, data: Dict) -> str:
-        """Build comprehensive prompt for Gemini."""
-        
-        client_name = data['client_info'].get('Client Name', 'Unknown')
-        product_name = data['client_info'].get('Product Name', 'Unknown')
-        
-        # Collect all relevant information
-        all_text = []
-        all_text.append(f"CLIENT: {client_name}")
-        all_text.append(f"PRODUCT: {product_name}\n")
-        
-        # Add all questions and answers
-        all_text.append("QUESTIONNAIRE DATA:\n")
-        for qa in data['all_qa']:
-            all_text.append(f"Section: {qa['section']}")
-            all_text.append(f"Q: {qa['question']}")
-            all_text.append(f"A: {qa['answer']}\n")
-        
-        questionnaire_text = "\n".join(all_text)
-        
-        prompt = f"""You are an expert user research and UX strategist. Analyze the following questionnaire data and create comprehensive User Personas.
+    return {
+        'type': 'OBJECT',
+        'properties': {'personas': {'type': 'ARRAY', 'items': require_all(persona)}},
+        'required': ['personas'],
+    }
+
 
-{questionnaire_text}
+# Sampling settings shared by every Gemini request. JSON mode with a schema makes Gemini return
+# bare, well-formed persona JSON (no markdown fences or prose around it).
+GENERATION_CONFIG: Dict = {
+    'temperature': 0.7,
+    'max_output_tokens': 8192,
+    'response_mime_type': 'application/json',
+    'response_schema': _persona_response_schema(),
+}
 
-Based on this questionnaire, create detailed user personas that represent the ideal clients/users for this product/service.
+# Error message fragments worth retrying with exponential backoff
+RETRYABLE_ERRORS: Tuple[str, ...] = ('rate limit', 'quota', 'timeout', '503', '429', '500', '502')
+
+# Upper bound on a single retry wait, in seconds
+MAX_RETRY_DELAY = 30
+
+# Static instructions and JSON schema, identical for every request. They open the prompt so requests
+# share a cacheable prefix; only the questionnaire data and task that follow vary.
+PROMPT_PREFIX = """You are an expert user research and UX strategist. You will be given questionnaire data and asked to create comprehensive User Personas from it.
 
 For each persona, provide:
 1. Persona Name - A memorable, descriptive name
@@ -301,12 +140,12 @@ For each persona, provide:
 11. Key Characteristics - 5-7 bullet points summarizing them
 
 Return your response as a JSON object with this structure:
-{{
+{
   "personas": [
-    {{
+    {
       "persona_name": "Name",
       "persona_type": "Primary/Secondary/Tertiary",
-      "demographics": {{
+      "demographics": {
         "age_range": "35-55",
         "gender": "Mixed (60% M, 40% F)",
         "location": "Primary: UK, Germany, Middle East",
@@ -315,13 +154,13 @@ Return your response as a JSON object with this structure:
         "education": "University degree or higher",
         "occupation": "Business owners, C-level executives",
         "family_status": "Married/partnered, often with children"
-      }},
-      "psychographics": {{
+      },
+      "psychographics": {
         "values": ["value1", "value2"],
         "motivations": ["motivation1", "motivation2"],
         "lifestyle": "Description",
         "interests": ["interest1", "interest2"]
-      }},
+      },
       "goals": [
         "Goal 1",
         "Goal 2"
@@ -338,25 +177,933 @@ Return your response as a JSON object with this structure:
         "Pain point 1",
         "Pain point 2"
       ],
-      "behavior": {{
+      "behavior": {
         "research_style": "Description",
         "decision_making": "Description",
         "communication_preferences": "Description",
         "online_behavior": "Description"
-      }},
+      },
       "quote": "\"A representative quote in their voice\"",
       "key_characteristics": [
         "Characteristic 1",
         "Characteristic 2",
         "Characteristic 3"
       ]
-    }}
+    }
   ]
-}}
+}"""
+
+# Lifetime of the Gemini context cache holding PROMPT_PREFIX
+CONTEXT_CACHE_TTL = timedelta(hours=1)
+
+# Gemini requests in flight at once in batch runs; kept low to stay clear of per-minute rate limits (429s)
+DEFAULT_CONCURRENCY = 5
+
+
+def _join(value, sep: str = '; '):
+    """Join list values into a single cell, passing scalars through unchanged."""
+    return sep.join(value) if type(value) is list else value
+
+
+# Schema paths are at most two keys deep: split them into (section, key), with None for top-level fields
+_CELL_LOOKUPS: Tuple[Tuple[Optional[str], str, bool], ...] = tuple(
+    (path[0] if len(path) == 2 else None, path[-1], is_list) for _, path, is_list in PERSONA_CSV_SCHEMA
+)
+_NESTED_SECTIONS: Tuple[str, ...] = tuple(dict.fromkeys(section for section, _, _ in _CELL_LOOKUPS if section))
+
 
-Identify at least 2-3 distinct personas based on the questionnaire data. Be thorough and specific."""
+def _extract(parent, key: str, is_list: bool):
+    """Read one field from a persona (sub-)dict, returning '' for missing values."""
+    if not isinstance(parent, dict):
+        return ''
+    value = parent.get(key)
+    if value is None:
+        return ''
+    return _join(value) if is_list else value
+
+
+# Persona Type only takes a handful of values, so its cells are interned to share one str per type
+_PERSONA_TYPE_CELL = [col for col, _, _ in PERSONA_CSV_SCHEMA].index('Persona Type')
+
+
+def flatten_persona(persona: Dict, client_info: Dict) -> Tuple:
+    """Flatten a nested persona dict into a CSV row ordered like PERSONA_CSV_COLUMNS."""
+    # Resolve each nested section (demographics, psychographics, behavior) once per persona
+    sections = {section: persona.get(section) for section in _NESTED_SECTIONS}
+    sections[None] = persona
+    cells = [_extract(sections[section], key, is_list) for section, key, is_list in _CELL_LOOKUPS]
+    if type(cells[_PERSONA_TYPE_CELL]) is str:
+        cells[_PERSONA_TYPE_CELL] = sys.intern(cells[_PERSONA_TYPE_CELL])
+    return (
+        client_info.get('Client Name', ''),
+        client_info.get('Product Name', ''),
+        *cells,
+    )
+
+
+class QuestionnaireParser:
+    """Parses questionnaire CSV files and extracts relevant information."""
+    
+    # Section names containing any of these are treated as persona-related
+    PERSONA_SECTION_KEYWORDS: Tuple[str, ...] = ('Persona', 'Audience', 'Customer')
+    
+    # Answers (lowercased) that carry no information; such rows are skipped like empty ones
+    PLACEHOLDER_ANSWERS = frozenset({'n/a', 'na', '-', '--', '.', '?'})
+    
+    def __init__(self, csv_path: Union[str, TextIO], section_col: str = 'Section', question_col: str = 'Question', answer_col: str = 'Answer'):
+        self.csv_path = csv_path
+        self.df = None
+        self.client_info = {}
+        self.questions_answers = []
+        # Number of Q&A pairs in persona-related sections (only the count is used downstream)
+        self.persona_count = 0
+        self.section_col = section_col
+        self.question_col = question_col
+        self.answer_col = answer_col
+        # Header columns seen by parse(), so get_columns() needn't re-read the file
+        self._fieldnames: Optional[List[str]] = None
+        # Uppercased once for header detection
+        self._question_upper = question_col.upper() if question_col else ''
+        self._answer_upper = answer_col.upper() if answer_col else ''
+    
+    @classmethod
+    def from_dataframe(cls, df, client_info: Optional[Dict] = None, section_col: str = 'Section', question_col: str = 'Question', answer_col: str = 'Answer') -> 'QuestionnaireParser':
+        """Create a parser over an already loaded questionnaire table (string cells, header row as columns)."""
+        parser = cls('', section_col=section_col, question_col=question_col, answer_col=answer_col)
+        parser.df = df
+        parser.client_info = dict(client_info or {})
+        return parser
+    
+    @staticmethod
+    def parse_metadata(lines) -> Dict[str, str]:
+        """Extract 'key,value' metadata from the rows above the CSV header."""
+        metadata = {}
+        for line in lines:
+            if ',' in line:
+                parts = line.strip().split(',', 1)
+                if len(parts) == 2:
+                    key, value = parts
+                    metadata[key.strip()] = value.strip()
+        return metadata
+    
+    def _open(self):
+        """Open the CSV source - either a file path or an already open text stream."""
+        if hasattr(self.csv_path, 'read'):
+            self.csv_path.seek(0)
+            return contextlib.nullcontext(self.csv_path)
+        return open(self.csv_path, 'r', encoding='utf-8-sig', errors='replace')
+    
+    def _is_header_row(self, line: str) -> bool:
+        """Check whether a line is the Question/Answer header row (exact column names)."""
+        # Cheap rejection first: header rows are CSV lines
+        if ',' not in line:
+            return False
+        line_upper = line.upper()
+        # Check if line contains both "QUESTION" and "ANSWER" as separate words/columns
+        has_question = (self._question_upper and self._question_upper in line_upper) or 'QUESTION' in line_upper
+        has_answer = (self._answer_upper and self._answer_upper in line_upper) or 'ANSWER' in line_upper
+        
+        # Must have both QUESTION and ANSWER, and avoid false positives like "QUESTIONNAIRE"
+        if not (has_question and has_answer):
+            return False
+        # Double check - make sure it's not just "QUESTIONNAIRE TYPE" or similar
+        parts = [p.strip() for p in line_upper.split(',')]
+        # Check if QUESTION and ANSWER are actual column headers (not part of other words)
+        return any('QUESTION' == p or (self._question_upper and self._question_upper == p) for p in parts) and \
+            any('ANSWER' == p or (self._answer_upper and self._answer_upper == p) for p in parts)
+    
+    def _read_preamble(self, f) -> Tuple[List[str], Optional[str]]:
+        """Read lines up to the header row; returns the metadata lines and the header line (None if not found)."""
+        preamble = []
+        for line in f:
+            if self._is_header_row(line):
+                return preamble, line
+            preamble.append(line)
+        return preamble, None
+    
+    def _map_columns(self, available_columns) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+        """Map the configured column names to actual CSV column names (case-insensitive)."""
+        section_col_name = None
+        question_col_name = None
+        answer_col_name = None
+        
+        for col in available_columns:
+            if col:
+                col_lower = col.strip().lower()
+                if self.section_col and col_lower == self.section_col.lower():
+                    section_col_name = col
+                if self.question_col and col_lower == self.question_col.lower():
+                    question_col_name = col
+                if self.answer_col and col_lower == self.answer_col.lower():
+                    answer_col_name = col
+        
+        return section_col_name, question_col_name, answer_col_name
+    
+    @staticmethod
+    def _select_cells(reader, header: List[str], columns) -> Iterator[Tuple[str, ...]]:
+        """Yield the cells of the given columns from each csv.reader row; missing columns or cells read as ''."""
+        # Duplicate header names resolve to their last occurrence, as csv.DictReader does
+        positions = {col: i for i, col in enumerate(header)}
+        indices = [positions[col] if col else None for col in columns]
+        if None in indices:
+            for row in reader:
+                yield tuple(row[i] if i is not None and i < len(row) else '' for i in indices)
+            return
+        getter = itemgetter(*indices)
+        width = max(indices) + 1
+        for row in reader:
+            if len(row) < width:
+                row += [''] * (width - len(row))
+            yield getter(row)
+    
+    def _add_rows(self, rows) -> None:
+        """Collect (section, question, answer) cell triples, skipping unanswered and repeated Q&A pairs."""
+        keywords = self.PERSONA_SECTION_KEYWORDS
+        placeholders = self.PLACEHOLDER_ANSWERS
+        # Identical question/answer pairs add prompt tokens but no signal, so keep the first only
+        seen = set()
+        # Sections repeat on every row, so classify each distinct section name once and
+        # share one string object per section across all of its Q&A pairs
+        persona_sections = {}
+        persona_count = 0
+        for section, question, answer in rows:
+            section = section.strip() if type(section) is str else ''
+            question = question.strip() if type(question) is str else ''
+            answer = answer.strip() if type(answer) is str else ''
+            
+            # Skip empty rows and placeholder answers
+            if not question or not answer or answer.lower() in placeholders:
+                continue
+            if (question, answer) in seen:
+                continue
+            seen.add((question, answer))
+            
+            # If no section column, use empty string or 'General'
+            if not section:
+                section = 'General'
+            
+            entry = persona_sections.get(section)
+            if entry is None:
+                entry = persona_sections[section] = (section, any(keyword in section for keyword in keywords))
+            section, is_persona = entry
+            
+            self.questions_answers.append({
+                'section': section,
+                'question': question,
+                'answer': answer
+            })
+            
+            # Count persona-related sections
+            if is_persona:
+                persona_count += 1
         
-        return prompt
+        self.persona_count += persona_count
+    
+    def _result(self) -> Dict:
+        """Structured questionnaire data returned by parse()."""
+        return {
+            'client_info': self.client_info,
+            'all_qa': self.questions_answers,
+            'persona_count': self.persona_count
+        }
+        
+    def parse(self) -> Dict:
+        """Parse the CSV file and extract structured data."""
+        
+        if self.df is not None:
+            # Table already loaded - read the mapped columns directly
+            self._fieldnames = [str(col) for col in self.df.columns]
+            section_col_name, question_col_name, answer_col_name = self._map_columns(self._fieldnames)
+            # Rows without a question or answer are skipped anyway, so there is nothing to read
+            if not question_col_name or not answer_col_name:
+                return self._result()
+            self._add_rows(zip(
+                self.df[section_col_name] if section_col_name else itertools.repeat('', len(self.df)),
+                self.df[question_col_name],
+                self.df[answer_col_name],
+            ))
+            return self._result()
+        
+        with self._open() as f:
+            # Single pass: collect metadata rows until the header, then keep reading the same handle as CSV
+            preamble, header_line = self._read_preamble(f)
+            
+            # Extract metadata from first few rows (before CSV headers)
+            self.client_info.update(self.parse_metadata(preamble))
+            
+            if header_line is None:
+                # If no header found, try reading from start
+                lines = iter(preamble)
+            else:
+                lines = itertools.chain((header_line,), f)
+            
+            # Read questions and answers by column index (no per-row dict as with DictReader)
+            reader = csv.reader(lines)
+            self._fieldnames = next(reader, [])
+            
+            # Use mapped column names
+            self._add_rows(self._select_cells(reader, self._fieldnames, self._map_columns(self._fieldnames)))
+        
+        return self._result()
+    
+    def get_columns(self) -> List[str]:
+        """Get list of column names from CSV file (the header row parse() reads from)."""
+        if self._fieldnames is None:
+            with self._open() as f:
+                preamble, header_line = self._read_preamble(f)
+                # Same fallback as parse(): without a header row the first line holds the column names
+                first_line = header_line if header_line is not None else next(iter(preamble), None)
+                self._fieldnames = next(csv.reader([first_line]), []) if first_line is not None else []
+        return list(self._fieldnames)
+
+
+class PromptCache:
+    """Content-addressed on-disk cache of generated personas, keyed by model name and prompt.
+    
+    Entries older than max_age seconds (if given) are treated as misses.
+    """
+    
+    def __init__(self, cache_dir: Optional[str] = None, max_memory_entries: int = 64,
+                 max_age: Optional[float] = None):
+        if cache_dir is None:
+            cache_dir = Path(os.getenv('XDG_CACHE_HOME', Path.home() / '.cache')) / 'persona_generator'
+        self.cache_dir = Path(cache_dir)
+        self.max_memory_entries = max_memory_entries
+        self.max_age = max_age
+        # Small in-process LRU of (stored_at, personas) so repeated hits don't re-read and re-decode the JSON file
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        # One lock per key, so concurrent misses on the same prompt make a single request. Entries are
+        # [lock, users] and are dropped once no caller holds or waits on them, so the maps don't grow.
+        self._key_locks: Dict[str, list] = {}
+        self._async_key_locks: Dict[str, list] = {}
+    
+    @staticmethod
+    def key(model_name: str, prompt: str) -> str:
+        """Cache key for a prompt sent to a given model."""
+        return hashlib.sha256((model_name + prompt).encode('utf-8')).hexdigest()
+    
+    @contextlib.contextmanager
+    def lock(self, key: str) -> Iterator[None]:
+        """Serialise requests for one key; hold it across a miss and the following put."""
+        lock = self._checkout(self._key_locks, key, threading.Lock)
+        try:
+            with lock:
+                yield
+        finally:
+            self._checkin(self._key_locks, key)
+    
+    @contextlib.asynccontextmanager
+    async def async_lock(self, key: str):
+        """Async variant of lock() for callers on an event loop."""
+        lock = self._checkout(self._async_key_locks, key, asyncio.Lock)
+        try:
+            async with lock:
+                yield
+        finally:
+            self._checkin(self._async_key_locks, key)
+    
+    def _checkout(self, locks: Dict[str, list], key: str, factory):
+        """Return the lock for a key, creating it if needed, and count the caller as a user."""
+        with self._lock:
+            entry = locks.get(key)
+            if entry is None:
+                entry = locks[key] = [factory(), 0]
+            entry[1] += 1
+            return entry[0]
+    
+    def _checkin(self, locks: Dict[str, list], key: str):
+        """Release a caller's use of a key lock, dropping the lock once it has no users."""
+        with self._lock:
+            entry = locks[key]
+            entry[1] -= 1
+            if not entry[1]:
+                del locks[key]
+    
+    def get(self, key: str) -> Optional[List[Dict]]:
+        """Return the cached personas for a key, or None on a miss."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and not self._expired(entry[0]):
+                self._memory.move_to_end(key)
+                return entry[1]
+        path = self.cache_dir / f"{key}.json"
+        try:
+            stored_at = path.stat().st_mtime
+            if self._expired(stored_at):
+                return None
+            with open(path, 'rb') as f:
+                personas = _json_loads(f.read())
+        except (OSError, ValueError):
+            return None
+        self._remember(key, personas, stored_at)
+        return personas
+    
+    def put(self, key: str, personas: List[Dict]):
+        """Store personas for a key, writing the file atomically (temp file + rename)."""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=self.cache_dir, suffix='.tmp', delete=False) as f:
+            json.dump(personas, f, ensure_ascii=False)
+        os.replace(f.name, self.cache_dir / f"{key}.json")
+        self._remember(key, personas, time.time())
+    
+    def _expired(self, stored_at: float) -> bool:
+        """Whether an entry stored at the given time is older than max_age."""
+        return self.max_age is not None and time.time() - stored_at > self.max_age
+    
+    def _remember(self, key: str, personas: List[Dict], stored_at: float):
+        """Add an entry to the in-process LRU, evicting the oldest beyond max_memory_entries."""
+        with self._lock:
+            self._memory[key] = (stored_at, personas)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+
+class PersonaStreamParser:
+    """Incrementally pulls complete persona objects out of a streamed JSON response."""
+    
+    def __init__(self):
+        self.text = ''
+        self.complete = False
+        self._pos = None  # index inside the "personas" array once it has been found
+        self._decoder = json.JSONDecoder()
+    
+    def feed(self, chunk: str) -> List[Dict]:
+        """Add a chunk of response text and return the personas completed by it."""
+        self.text += chunk
+        personas = []
+        if self.complete:
+            return personas
+        
+        if self._pos is None:
+            key_idx = self.text.find('"personas"')
+            start_idx = self.text.find('[', key_idx) if key_idx != -1 else -1
+            if start_idx == -1:
+                return personas
+            self._pos = start_idx + 1
+        
+        text = self.text
+        while True:
+            # Skip whitespace and separators between array items
+            pos = self._pos
+            while pos < len(text) and text[pos] in ' \t\r\n,':
+                pos += 1
+            self._pos = pos
+            if pos >= len(text):
+                break
+            if text[pos] != '{':
+                # End of the array (or an unexpected layout left to the full decoder)
+                self.complete = True
+                break
+            try:
+                persona, self._pos = self._decoder.raw_decode(text, pos)
+            except json.JSONDecodeError:
+                # Object not complete yet - wait for more text
+                break
+            personas.append(persona)
+        return personas
+
+
+# google.generativeai (with its gRPC/protobuf stack) is imported on first use, not at module import,
+# so parsing-only callers and `--help` don't pay for loading the SDK.
+# genai.configure is process-global; only re-run it when the API key changes. The key is compared
+# by digest so this module doesn't keep its own copy of the raw key.
+_configure_lock = threading.Lock()
+_configured_key_digest: Optional[str] = None
+
+
+def _configure_once(api_key: str) -> None:
+    """Configure the Gemini client for api_key unless it is already the configured key."""
+    global _configured_key_digest
+    import google.generativeai as genai
+    key_digest = hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+    with _configure_lock:
+        if key_digest != _configured_key_digest:
+            genai.configure(api_key=api_key)
+            _configured_key_digest = key_digest
+            # A GenerativeModel binds the process-global client on its first request, so shared
+            # models that may already hold the previous key's client must not be handed out again
+            _get_model.cache_clear()
+
+
+@functools.lru_cache(maxsize=8)
+def _get_model(model_name: str) -> 'genai.GenerativeModel':
+    """Shared GenerativeModel per model name; cleared by _configure_once when the API key changes."""
+    import google.generativeai as genai
+    return genai.GenerativeModel(model_name)
+
+
+class GeminiPersonaGenerator:
+    """Uses Gemini 2.5 Flash to generate user personas from questionnaire data."""
+    
+    def __init__(self, api_key: Optional[str] = None, cache: Optional[PromptCache] = None,
+                 use_context_cache: bool = False):
+        if api_key is None:
+            _load_dotenv()
+            api_key = os.getenv('GEMINI_API_KEY')
+            if not api_key:
+                raise ValueError(
+                    "GEMINI_API_KEY environment variable not set. "
+                    "Please set it or pass api_key parameter."
+                )
+        
+        _configure_once(api_key)
+        # Using Gemini 2.5 Flash model
+        model_name = os.getenv('GEMINI_MODEL', 'gemini-2.5-flash')
+        self.model_name = model_name
+        self.model = _get_model(model_name)
+        # Optional persona cache; repeated prompts skip the API call entirely
+        self.cache = cache
+        # Optionally upload PROMPT_PREFIX once as Gemini cached content and send only the suffix per request
+        self.use_context_cache = use_context_cache
+        self._context_model = None
+        self._context_expires = 0.0
+        self._context_lock = threading.Lock()
+        # Token usage reported by Gemini; cached_tokens counts prompt tokens served from its prefix cache
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self._usage_lock = threading.Lock()
+    
+    def generate_personas(self, questionnaire_data: Dict, max_retries: int = 3) -> List[Dict]:
+        """Generate comprehensive user personas using Gemini with retry logic."""
+        
+        # Build prompt with all relevant information
+        prompt = self._build_prompt(questionnaire_data)
+        return self._generate(prompt, max_retries)
+    
+    def generate_persona(self, questionnaire_data: Dict, persona_type: str, max_retries: int = 3,
+                         other_types: Tuple[str, ...] = ()) -> List[Dict]:
+        """Generate a single persona of the given type, distinct from any other_types requested alongside it."""
+        prompt = self._build_prompt(questionnaire_data, persona_type, other_types)
+        return self._generate(prompt, max_retries)
+    
+    def generate_personas_concurrent(self, questionnaire_data: Dict, persona_types=PERSONA_TYPES,
+                                     max_retries: int = 3) -> List[Dict]:
+        """Generate one persona per type with concurrent Gemini requests.
+        
+        The requests are network-bound, so running them in threads brings the wall-clock
+        time down to roughly the slowest single request.
+        """
+        with ThreadPoolExecutor(max_workers=len(persona_types)) as executor:
+            futures = [
+                executor.submit(self.generate_persona, questionnaire_data, persona_type, max_retries,
+                                self._other_types(persona_types, persona_type))
+                for persona_type in persona_types
+            ]
+        return self._merge_by_type(persona_types, [future.exception() or future.result() for future in futures])
+    
+    async def generate_persona_async(self, questionnaire_data: Dict, persona_type: str,
+                                     max_retries: int = 3, other_types: Tuple[str, ...] = ()) -> List[Dict]:
+        """Async variant of generate_persona."""
+        prompt = self._build_prompt(questionnaire_data, persona_type, other_types)
+        return await self._generate_async(prompt, max_retries)
+    
+    async def generate_personas_concurrent_async(self, questionnaire_data: Dict, persona_types=PERSONA_TYPES,
+                                                 max_retries: int = 3,
+                                                 semaphore: Optional[asyncio.Semaphore] = None) -> List[Dict]:
+        """Async variant of generate_personas_concurrent, for use inside an event loop.
+        
+        Each per-type request holds a slot of semaphore (if given), so a caller's request cap
+        counts Gemini calls rather than questionnaires.
+        """
+        async def generate(persona_type: str) -> List[Dict]:
+            other_types = self._other_types(persona_types, persona_type)
+            if semaphore is None:
+                return await self.generate_persona_async(questionnaire_data, persona_type, max_retries, other_types)
+            async with semaphore:
+                return await self.generate_persona_async(questionnaire_data, persona_type, max_retries, other_types)
+        
+        results = await asyncio.gather(
+            *(generate(persona_type) for persona_type in persona_types),
+            return_exceptions=True
+        )
+        return self._merge_by_type(persona_types, results)
+    
+    @staticmethod
+    def _other_types(persona_types, persona_type: str) -> Tuple[str, ...]:
+        """The persona types requested alongside persona_type."""
+        return tuple(other for other in persona_types if other != persona_type)
+    
+    @staticmethod
+    def _merge_by_type(persona_types, results) -> List[Dict]:
+        """Merge per-type results (persona lists or exceptions) in persona type order."""
+        personas = []
+        errors = []
+        for persona_type, result in zip(persona_types, results):
+            if isinstance(result, BaseException):
+                print(f"Failed to generate {persona_type} persona: {result}")
+                errors.append(result)
+            else:
+                personas.extend(result)
+        
+        # Return whatever succeeded; only fail when every request failed
+        if not personas and errors:
+            raise errors[0]
+        return personas
+    
+    def stream_personas(self, questionnaire_data: Dict, persona_type: Optional[str] = None,
+                        max_retries: int = 3) -> Iterator[Dict]:
+        """Yield personas as soon as each one is complete in the streamed Gemini response.
+        
+        Errors are retried only until the first persona has been yielded.
+        """
+        prompt = self._build_prompt(questionnaire_data, persona_type)
+        key = PromptCache.key(self.model_name, prompt) if self.cache else None
+        cached = self.cache.get(key) if key else None
+        if cached is not None:
+            yield from cached
+            return
+        
+        personas = []
+        # Cut-off or salvaged results are returned but not cached, so a later run asks Gemini again
+        complete = True
+        for attempt in range(max_retries):
+            try:
+                model, contents = self._route(prompt)
+                response = model.generate_content(
+                    contents,
+                    generation_config=GENERATION_CONFIG,
+                    stream=True
+                )
+                parser = PersonaStreamParser()
+                for chunk in response:
+                    # Chunks carrying only a finish reason or usage metadata have no parts (chunk.text raises on them)
+                    if not chunk.candidates or not chunk.candidates[0].content.parts:
+                        continue
+                    for persona in parser.feed(chunk.text):
+                        personas.append(persona)
+                        yield persona
+                
+                self._record_usage(response)
+                problem = self._finish_problem(response)
+                if problem:
+                    if not personas:
+                        raise ValueError(f"Gemini stopped without a usable response: {problem}")
+                    print(f"Gemini stopped early ({problem}); keeping the {len(personas)} persona(s) received")
+                    complete = False
+                    break
+                if not parser.complete:
+                    # Stream didn't parse incrementally (odd layout or truncated) - decode the full text
+                    try:
+                        remaining = self._decode_personas(parser.text)[len(personas):]
+                    except json.JSONDecodeError as e:
+                        self._log_json_error(e, parser.text, attempt, max_retries)
+                        remaining = [] if personas else self._parse_text_response(parser.text)
+                        complete = False
+                    for persona in remaining:
+                        personas.append(persona)
+                        yield persona
+                break
+            except Exception as e:
+                if personas:
+                    raise
+                time.sleep(self._retry_delay(e, attempt, max_retries))
+        
+        if key and personas and complete:
+            self.cache.put(key, personas)
+    
+    async def generate_personas_async(self, questionnaire_data: Dict, max_retries: int = 3) -> List[Dict]:
+        """Async variant of generate_personas, used to batch many questionnaires."""
+        prompt = self._build_prompt(questionnaire_data)
+        return await self._generate_async(prompt, max_retries)
+    
+    async def generate_many(self, datasets: List[Dict], max_concurrency: int = DEFAULT_CONCURRENCY,
+                            max_retries: int = 3) -> List[Union[List[Dict], Exception]]:
+        """Generate personas for many questionnaires with at most max_concurrency requests in flight.
+        
+        Results keep the order of datasets; a questionnaire that failed yields its exception
+        instead of a persona list, so one failure doesn't discard the rest of the batch.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def generate(questionnaire_data: Dict) -> List[Dict]:
+            async with semaphore:
+                return await self.generate_personas_async(questionnaire_data, max_retries)
+        
+        return await asyncio.gather(*(generate(data) for data in datasets), return_exceptions=True)
+    
+    def _generate(self, prompt: str, max_retries: int = 3) -> List[Dict]:
+        """Return the personas for a prompt, from the cache when possible."""
+        key = PromptCache.key(self.model_name, prompt) if self.cache else None
+        cached = self.cache.get(key) if key else None
+        if cached is not None:
+            return cached
+        if not key:
+            return self._request(prompt, max_retries)[0]
+        # Concurrent callers with the same prompt wait here and pick up the first caller's result
+        with self.cache.lock(key):
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+            personas, complete = self._request(prompt, max_retries)
+            if personas and complete:
+                self.cache.put(key, personas)
+        return personas
+    
+    async def _generate_async(self, prompt: str, max_retries: int = 3) -> List[Dict]:
+        """Async variant of _generate."""
+        key = PromptCache.key(self.model_name, prompt) if self.cache else None
+        cached = self.cache.get(key) if key else None
+        if cached is not None:
+            return cached
+        if not key:
+            return (await self._request_async(prompt, max_retries))[0]
+        async with self.cache.async_lock(key):
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+            personas, complete = await self._request_async(prompt, max_retries)
+            if personas and complete:
+                self.cache.put(key, personas)
+        return personas
+    
+    def _request(self, prompt: str, max_retries: int = 3) -> Tuple[List[Dict], bool]:
+        """Send a prompt to Gemini and parse the personas from the JSON response.
+        
+        Returns the personas and whether they came from well-formed JSON (salvaged results aren't cached).
+        """
+        
+        # Retry logic for API calls
+        last_exception = None
+        for attempt in range(max_retries):
+            try:
+                model, contents = self._route(prompt)
+                response = model.generate_content(
+                    contents,
+                    generation_config=GENERATION_CONFIG
+                )
+                result = self._handle_response(response, attempt, max_retries)
+                if result is not None:
+                    return result
+                # Unparseable JSON - wait and retry
+                time.sleep(self._backoff(attempt))
+            except Exception as e:
+                last_exception = e
+                time.sleep(self._retry_delay(e, attempt, max_retries))
+        
+        # If we get here, all retries failed
+        raise self._retries_exhausted(last_exception)
+    
+    async def _request_async(self, prompt: str, max_retries: int = 3) -> Tuple[List[Dict], bool]:
+        """Async twin of _request, awaiting the request and the backoff instead of blocking."""
+        last_exception = None
+        for attempt in range(max_retries):
+            try:
+                model, contents = self._route(prompt)
+                response = await model.generate_content_async(
+                    contents,
+                    generation_config=GENERATION_CONFIG
+                )
+                result = self._handle_response(response, attempt, max_retries)
+                if result is not None:
+                    return result
+                await asyncio.sleep(self._backoff(attempt))
+            except Exception as e:
+                last_exception = e
+                await asyncio.sleep(self._retry_delay(e, attempt, max_retries))
+        
+        raise self._retries_exhausted(last_exception)
+    
+    def _handle_response(self, response, attempt: int, max_retries: int) -> Optional[Tuple[List[Dict], bool]]:
+        """Decode (personas, complete) from one attempt's response; None means the JSON was unparseable and worth a retry."""
+        self._record_usage(response)
+        # Check if response has text
+        if not hasattr(response, 'text') or not response.text:
+            raise ValueError("Empty response from API")
+        
+        try:
+            return self._decode_personas(response.text), True
+        except json.JSONDecodeError as e:
+            self._log_json_error(e, response.text, attempt, max_retries)
+            # If this is the last attempt, try fallback parser (usable, but too partial to cache)
+            if attempt == max_retries - 1:
+                return self._parse_text_response(response.text), False
+            return None
+    
+    @staticmethod
+    def _retries_exhausted(last_exception: Optional[Exception]) -> Exception:
+        """Error to raise once every attempt has failed."""
+        if last_exception:
+            return Exception(f"Failed to generate personas: {str(last_exception)}")
+        return Exception("Failed to generate personas: Unknown error")
+    
+    def _route(self, prompt: str):
+        """Pick the model and contents for a prompt, sending only the suffix when PROMPT_PREFIX is context-cached."""
+        if self.use_context_cache and prompt.startswith(PROMPT_PREFIX):
+            model = self._context_cached_model()
+            if model is not None:
+                return model, prompt[len(PROMPT_PREFIX):].lstrip()
+        return self.model, prompt
+    
+    def _context_cached_model(self):
+        """Return a model bound to cached PROMPT_PREFIX content, (re)creating it when it expires."""
+        with self._context_lock:
+            # Another request may have given up on caching while this one waited for the lock
+            if self.use_context_cache and (self._context_model is None or time.time() >= self._context_expires):
+                try:
+                    import google.generativeai as genai
+                    from google.generativeai import caching
+                    cached = caching.CachedContent.create(
+                        model=f"models/{self.model_name}",
+                        system_instruction=PROMPT_PREFIX,
+                        ttl=CONTEXT_CACHE_TTL,
+                    )
+                    self._context_model = genai.GenerativeModel.from_cached_content(cached)
+                    # Refresh a minute early so requests never race the expiry
+                    self._context_expires = time.time() + CONTEXT_CACHE_TTL.total_seconds() - 60
+                except Exception as e:
+                    # e.g. prefix below the model's minimum cacheable size, or caching unavailable
+                    print(f"Context caching unavailable, sending full prompts: {e}")
+                    self.use_context_cache = False
+                    self._context_model = None
+            return self._context_model
+    
+    @staticmethod
+    def _finish_problem(response) -> Optional[str]:
+        """Why a response ended abnormally (blocked prompt, safety stop, ...), or None if it finished normally.
+        
+        Hitting max_output_tokens counts as normal: the truncated JSON is recovered by _decode_personas.
+        """
+        from google.generativeai import protos
+        if not response.candidates:
+            return f"prompt blocked ({response.prompt_feedback})"
+        finish_reason = response.candidates[0].finish_reason
+        FinishReason = protos.Candidate.FinishReason
+        if finish_reason in (FinishReason.STOP, FinishReason.MAX_TOKENS, FinishReason.FINISH_REASON_UNSPECIFIED):
+            return None
+        return FinishReason(finish_reason).name
+    
+    def _record_usage(self, response) -> None:
+        """Add a response's prompt and cached token counts to the running totals."""
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is None:
+            return
+        with self._usage_lock:
+            self.prompt_tokens += getattr(usage, 'prompt_token_count', 0) or 0
+            self.cached_tokens += getattr(usage, 'cached_content_token_count', 0) or 0
+    
+    def _decode_personas(self, text: str) -> List[Dict]:
+        """Extract the JSON payload from a Gemini response and return its personas."""
+        # Extract JSON from markdown if present
+        text = text.strip()
+        
+        # Try to find JSON in markdown code blocks
+        fence_idx = text.find('```json')
+        if fence_idx >= 0:
+            # Slice between the opening fence and the next ``` (or the end, if the response was cut off)
+            start_idx = fence_idx + len('```json')
+            end_idx = text.find('```', start_idx)
+            text = text[start_idx:end_idx if end_idx >= 0 else len(text)].strip()
+        elif '```' in text:
+            # Try to extract from any code block
+            parts = text.split('```')
+            for i, part in enumerate(parts):
+                if '{' in part and '[' in part:
+                    text = part.strip()
+                    break
+        
+        # Try to find JSON object/array boundaries
+        if not text.startswith(('{', '[')):
+            # Look for first { or [ - the '[' search stops where the first '{' is
+            brace_idx = text.find('{')
+            bracket_idx = text.find('[', 0, brace_idx if brace_idx >= 0 else len(text))
+            start_idx = bracket_idx if bracket_idx >= 0 else brace_idx
+            if start_idx >= 0:
+                text = text[start_idx:]
+        
+        # Try to find the end of JSON (might be incomplete) - count each bracket once
+        missing_braces = text.count('{') - text.count('}')
+        missing_brackets = text.count('[') - text.count(']')
+        if missing_braces > 0 or missing_brackets > 0:
+            # Incomplete JSON - try to close it
+            text = ''.join((text, '}' * max(missing_braces, 0), ']' * max(missing_brackets, 0)))
+        
+        personas_data = _json_loads(text)
+        
+        # Handle both direct list and wrapped in object
+        if isinstance(personas_data, list):
+            return personas_data
+        elif isinstance(personas_data, dict):
+            return personas_data.get('personas', [])
+        else:
+            raise ValueError(f"Unexpected response format: {type(personas_data)}")
+    
+    def _log_json_error(self, e: json.JSONDecodeError, text: str, attempt: int, max_retries: int):
+        """Log a JSON parsing failure for debugging."""
+        print(f"JSON parsing error (attempt {attempt + 1}/{max_retries}): {e}")
+        print(f"Response text (first 500 chars): {text[:500]}")
+    
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        """Capped exponential backoff, jittered so concurrent requests don't retry in lockstep."""
+        return min(2 ** attempt * random.uniform(1, 1.5), MAX_RETRY_DELAY)
+    
+    def _retry_delay(self, e: Exception, attempt: int, max_retries: int) -> float:
+        """Return the backoff delay for a failed API call, raising when it shouldn't be retried."""
+        from google.api_core import exceptions as google_exceptions
+        error_msg = str(e).lower()
+        
+        # Check if it's a retryable error (by API exception type, or by message for other transports)
+        is_retryable = isinstance(e, (
+            google_exceptions.ResourceExhausted,
+            google_exceptions.ServiceUnavailable,
+            google_exceptions.DeadlineExceeded,
+            google_exceptions.InternalServerError,
+        )) or any(err in error_msg for err in RETRYABLE_ERRORS)
+        
+        print(f"API error (attempt {attempt + 1}/{max_retries}): {e}")
+        
+        if attempt < max_retries - 1 and is_retryable:
+            # Wait before retrying (exponential backoff)
+            wait_time = self._backoff(attempt)
+            print(f"Retrying in {wait_time:.1f} seconds...")
+            return wait_time
+        # Non-retryable error or last attempt
+        raise Exception(f"Failed to generate personas after {attempt + 1} attempts: {str(e)}")
+    
+    def _build_prompt(self, data: Dict, persona_type: Optional[str] = None,
+                      other_types: Tuple[str, ...] = ()) -> str:
+        """Build comprehensive prompt for Gemini, optionally asking for a single persona type."""
+        return f"{PROMPT_PREFIX}\n\n{self._dynamic_suffix(data, persona_type, other_types)}"
+    
+    def _dynamic_suffix(self, data: Dict, persona_type: Optional[str] = None,
+                        other_types: Tuple[str, ...] = ()) -> str:
+        """Build the per-request part of the prompt: questionnaire data and task."""
+        
+        client_name = data['client_info'].get('Client Name', 'Unknown')
+        product_name = data['client_info'].get('Product Name', 'Unknown')
+        
+        # Client header followed by all questions and answers, one formatted block per Q&A pair
+        questionnaire_text = f"CLIENT: {client_name}\nPRODUCT: {product_name}\n\nQUESTIONNAIRE DATA:\n" + "".join(
+            f"\nSection: {qa['section']}\nQ: {qa['question']}\nA: {qa['answer']}\n" for qa in data['all_qa']
+        )
+        
+        if persona_type:
+            task = f"create one detailed {persona_type} user persona that represents the ideal clients/users for this product/service"
+            closing = f'Return exactly one persona with persona_type "{persona_type}"'
+            if persona_type in PERSONA_TYPE_ROLES:
+                closing += f", representing {PERSONA_TYPE_ROLES[persona_type]}"
+            closing += "."
+            if other_types:
+                # Each request only sees its own type, so spell out what the other personas cover
+                others = " and ".join(
+                    f"{other} ({PERSONA_TYPE_ROLES[other]})" if other in PERSONA_TYPE_ROLES else other
+                    for other in other_types
+                )
+                closing += (f" The {others} personas are generated separately from this same questionnaire; make"
+                            f" this persona a clearly different segment from them (different demographics, goals"
+                            f" and motivations), not a variation of the same person.")
+            closing += " Be thorough and specific."
+        else:
+            task = "create detailed user personas that represent the ideal clients/users for this product/service"
+            closing = "Identify at least 2-3 distinct personas based on the questionnaire data. Be thorough and specific."
+        
+        return f"""{questionnaire_text}
+
+Based on this questionnaire, {task}.
+
+{closing}"""
     
     def _parse_text_response(self, text: str) -> List[Dict]:
         """Fallback parser for text responses when JSON parsing fails."""
@@ -364,21 +1111,32 @@ Identify at least 2-3 distinct personas based on the questionnaire data. Be thor
         
         # Try to extract JSON-like structures from text
         try:
-            # Try to find JSON objects
-            json_pattern = r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}'
-            matches = re.findall(json_pattern, text, re.DOTALL)
-            
-            if matches:
-                # Try to parse the largest match (likely the full response)
-                largest_match = max(matches, key=len)
+            # Decode from each candidate '{' or '[' in turn - linear scan, any nesting depth
+            decoder = json.JSONDecoder()
+            salvaged = []
+            idx = 0
+            while True:
+                starts = [i for i in (text.find('{', idx), text.find('[', idx)) if i != -1]
+                if not starts:
+                    break
+                start = min(starts)
                 try:
-                    data = json.loads(largest_match)
-                    if isinstance(data, dict) and 'personas' in data:
-                        return data['personas']
-                    elif isinstance(data, list):
-                        return data
+                    data, end = decoder.raw_decode(text, start)
                 except json.JSONDecodeError:
-                    pass
+                    idx = start + 1
+                    continue
+                
+                if isinstance(data, dict) and 'personas' in data:
+                    return data['personas']
+                elif isinstance(data, list) and all(isinstance(item, dict) for item in data):
+                    return data
+                elif isinstance(data, dict) and 'persona_name' in data:
+                    # A complete persona whose surrounding wrapper was cut off
+                    salvaged.append(data)
+                idx = end
+            
+            if salvaged:
+                return salvaged
             
             # If no valid JSON found, return empty list
             print(f"Could not extract valid JSON from response. Response length: {len(text)}")
@@ -394,100 +1152,117 @@ class PersonaCSVExporter:
     def __init__(self, output_path: str):
         self.output_path = output_path
     
-    def export(self, personas: List[Dict], client_info: Dict):
-        """Export personas to CSV file."""
+    def export(self, personas: Iterable[Dict], client_info: Dict) -> int:
+        """Export personas to CSV file, writing each row as it arrives; returns the number exported."""
         
-        if not personas:
+        personas = iter(personas)
+        first = next(personas, None)
+        if first is None:
             print("No personas to export.")
-            return
+            return 0
         
-        # Flatten persona data for CSV
-        rows = []
+        count = 0
         
-        for persona in personas:
-            base_row = {
-                'Client Name': client_info.get('Client Name', ''),
-                'Product Name': client_info.get('Product Name', ''),
-                'Persona Name': persona.get('persona_name', ''),
-                'Persona Type': persona.get('persona_type', ''),
-            }
-            
-            # Demographics
-            demo = persona.get('demographics', {})
-            base_row.update({
-                'Age Range': demo.get('age_range', ''),
-                'Gender': demo.get('gender', ''),
-                'Location': demo.get('location', ''),
-                'Income Level': demo.get('income_level', ''),
-                'Net Worth': demo.get('net_worth', ''),
-                'Education': demo.get('education', ''),
-                'Occupation': demo.get('occupation', ''),
-                'Family Status': demo.get('family_status', ''),
-            })
-            
-            # Psychographics
-            psycho = persona.get('psychographics', {})
-            base_row.update({
-                'Values': '; '.join(psycho.get('values', [])) if isinstance(psycho.get('values'), list) else psycho.get('values', ''),
-                'Motivations': '; '.join(psycho.get('motivations', [])) if isinstance(psycho.get('motivations'), list) else psycho.get('motivations', ''),
-                'Lifestyle': psycho.get('lifestyle', ''),
-                'Interests': '; '.join(psycho.get('interests', [])) if isinstance(psycho.get('interests'), list) else psycho.get('interests', ''),
-            })
-            
-            # Goals, Challenges, Needs, Pain Points
-            base_row.update({
-                'Goals': '; '.join(persona.get('goals', [])) if isinstance(persona.get('goals'), list) else persona.get('goals', ''),
-                'Challenges': '; '.join(persona.get('challenges', [])) if isinstance(persona.get('challenges'), list) else persona.get('challenges', ''),
-                'Needs': '; '.join(persona.get('needs', [])) if isinstance(persona.get('needs'), list) else persona.get('needs', ''),
-                'Pain Points': '; '.join(persona.get('pain_points', [])) if isinstance(persona.get('pain_points'), list) else persona.get('pain_points', ''),
-            })
-            
-            # Behavior
-            behavior = persona.get('behavior', {})
-            base_row.update({
-                'Research Style': behavior.get('research_style', ''),
-                'Decision Making': behavior.get('decision_making', ''),
-                'Communication Preferences': behavior.get('communication_preferences', ''),
-                'Online Behavior': behavior.get('online_behavior', ''),
-            })
-            
-            # Quote and Characteristics
-            base_row.update({
-                'Quote': persona.get('quote', ''),
-                'Key Characteristics': '; '.join(persona.get('key_characteristics', [])) if isinstance(persona.get('key_characteristics'), list) else persona.get('key_characteristics', ''),
-            })
-            
-            rows.append(base_row)
+        def rows():
+            nonlocal count
+            for persona in itertools.chain((first,), personas):
+                count += 1
+                yield flatten_persona(persona, client_info)
         
-        # Write to CSV
-        if rows:
-            fieldnames = list(rows[0].keys())
-            
+        try:
             with open(self.output_path, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerows(rows)
-            
-            print(f"✓ Successfully exported {len(rows)} persona(s) to {self.output_path}")
+                self.write(f, rows())
+        except Exception:
+            # Don't leave a partial CSV behind when a streamed source fails midway
+            with contextlib.suppress(OSError):
+                os.remove(self.output_path)
+            raise
+        
+        print(f"✓ Successfully exported {count} persona(s) to {self.output_path}")
+        return count
+    
+    def write(self, f, rows):
+        """Stream flattened persona rows as CSV into an open text file."""
+        writer = csv.writer(f)
+        writer.writerow(PERSONA_CSV_COLUMNS)
+        writer.writerows(rows)
+
+
+def find_questionnaires(paths: List[str]) -> List[str]:
+    """Expand directories into the questionnaire CSVs they contain, skipping generated persona files."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(str(p) for p in sorted(Path(path).glob('*.csv')) if not p.name.startswith('personas_'))
+        else:
+            files.append(path)
+    return files
+
+
+async def process_questionnaires(generator: 'GeminiPersonaGenerator', input_csvs: List[str], output_path,
+                                 max_concurrency: int = DEFAULT_CONCURRENCY, per_type: bool = False) -> List[Union[str, Exception]]:
+    """Parse, generate and export each questionnaire, overlapping the stages of different files.
+    
+    Parsing and export run in worker threads while other files wait on Gemini; at most
+    max_concurrency Gemini requests are in flight (per_type sends one request per persona type
+    for each questionnaire). Returns the output path (or the exception) per input.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    # Backpressure: only parse up to one extra batch ahead of generation, so a large directory
+    # doesn't hold every parsed questionnaire in memory while waiting for a request slot
+    in_flight = asyncio.Semaphore(max_concurrency * 2)
+    
+    async def process(input_csv: str) -> str:
+        async with in_flight:
+            return await run_stages(input_csv)
+    
+    async def run_stages(input_csv: str) -> str:
+        questionnaire_data = await asyncio.to_thread(QuestionnaireParser(input_csv).parse)
+        print(f"✓ {input_csv}: found {len(questionnaire_data['all_qa'])} Q&A pairs "
+              f"({questionnaire_data['persona_count']} persona-related)")
+        
+        if per_type:
+            personas = await generator.generate_personas_concurrent_async(questionnaire_data, semaphore=semaphore)
+        else:
+            async with semaphore:
+                personas = await generator.generate_personas_async(questionnaire_data)
+        if not personas:
+            raise ValueError("No personas generated. Please check the API response.")
+        
+        output = output_path(input_csv)
+        await asyncio.to_thread(PersonaCSVExporter(output).export, personas, questionnaire_data['client_info'])
+        return output
+    
+    return await asyncio.gather(*(process(input_csv) for input_csv in input_csvs), return_exceptions=True)
+
+
+def print_token_usage(generator: 'GeminiPersonaGenerator') -> None:
+    """Report how many prompt tokens Gemini served from its (implicit or explicit) prompt cache."""
+    if generator.prompt_tokens:
+        print(f"ℹ️  Prompt tokens: {generator.prompt_tokens:,} "
+              f"({generator.cached_tokens:,} served from Gemini's prompt cache)")
 
 
 def main():
     """Main execution function."""
     import argparse
     
+    _load_dotenv()
+    
     parser = argparse.ArgumentParser(
         description='Generate User Personas from Questionnaire CSV using Gemini 2.5 Flash'
     )
     parser.add_argument(
         'input_csv',
         type=str,
-        help='Path to input questionnaire CSV file'
+        nargs='+',
+        help='Questionnaire CSV file(s) or directories of them (several files are processed concurrently)'
     )
     parser.add_argument(
         '-o', '--output',
         type=str,
         default=None,
-        help='Path to output CSV file (default: personas_<timestamp>.csv)'
+        help='Path to output CSV file, single input only (default: personas_<name>_<timestamp>.csv)'
     )
     parser.add_argument(
         '--api-key',
@@ -495,52 +1270,122 @@ def main():
         default=None,
         help='Gemini API key (or set GEMINI_API_KEY env variable)'
     )
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help=f'Maximum number of concurrent Gemini requests when processing several files '
+             f'(default: {DEFAULT_CONCURRENCY})'
+    )
+    parser.add_argument(
+        '--per-type',
+        action='store_true',
+        help='Request the Primary, Secondary and Tertiary personas as separate concurrent Gemini calls '
+             '(shorter responses, less truncation on large questionnaires)'
+    )
+    parser.add_argument(
+        '--cache-dir',
+        type=str,
+        default=None,
+        help='Directory for cached Gemini responses (default: ~/.cache/persona_generator)'
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Always call Gemini, ignoring and not writing the response cache'
+    )
+    parser.add_argument(
+        '--cache-ttl',
+        type=float,
+        default=None,
+        help='Ignore cached responses older than this many hours (default: never expire)'
+    )
+    parser.add_argument(
+        '--context-cache',
+        action='store_true',
+        help='Upload the static prompt instructions once as Gemini cached content (billed storage, 1h TTL)'
+    )
     
     args = parser.parse_args()
     
-    # Validate input file
-    if not os.path.exists(args.input_csv):
-        print(f"Error: Input file not found: {args.input_csv}")
+    input_csvs = find_questionnaires(args.input_csv)
+    if not input_csvs:
+        print("Error: No questionnaire CSV files found.")
+        sys.exit(1)
+    if args.output is not None and len(input_csvs) > 1:
+        parser.error('--output can only be used with a single input CSV')
+    
+    # Validate input files
+    for input_csv in input_csvs:
+        if not os.path.exists(input_csv):
+            print(f"Error: Input file not found: {input_csv}")
+            sys.exit(1)
+    
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    
+    def output_path(input_csv: str) -> str:
+        if args.output is not None:
+            return args.output
+        base_name = Path(input_csv).stem
+        output_dir = Path(input_csv).parent
+        return str(output_dir / f"personas_{base_name}_{timestamp}.csv")
+    
+    try:
+        max_age = args.cache_ttl * 3600 if args.cache_ttl is not None else None
+        cache = None if args.no_cache else PromptCache(args.cache_dir, max_age=max_age)
+        generator = GeminiPersonaGenerator(api_key=args.api_key, cache=cache, use_context_cache=args.context_cache)
+    except Exception as e:
+        print(f"Error generating personas: {e}")
         sys.exit(1)
     
-    # Set output path
-    if args.output is None:
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        base_name = Path(args.input_csv).stem
-        output_dir = Path(args.input_csv).parent
-        args.output = str(output_dir / f"personas_{base_name}_{timestamp}.csv")
+    if len(input_csvs) > 1:
+        # Several questionnaires: parse, generate and export them as overlapping pipelines
+        print(f"🤖 Generating personas for {len(input_csvs)} questionnaires using Gemini 2.5 Flash...")
+        results = asyncio.run(
+            process_questionnaires(generator, input_csvs, output_path, args.concurrency, args.per_type)
+        )
+        
+        failed = 0
+        for input_csv, result in zip(input_csvs, results):
+            if isinstance(result, Exception):
+                print(f"Error generating personas for {input_csv}: {result}")
+                failed += 1
+        
+        print_token_usage(generator)
+        print(f"\n✅ Complete! {len(input_csvs) - failed} of {len(input_csvs)} questionnaire(s) exported.")
+        if failed:
+            sys.exit(1)
+        return
     
-    print(f"📋 Parsing questionnaire: {args.input_csv}")
+    input_csv = input_csvs[0]
+    print(f"📋 Parsing questionnaire: {input_csv}")
     
     # Parse questionnaire
-    parser = QuestionnaireParser(args.input_csv)
+    parser = QuestionnaireParser(input_csv)
     questionnaire_data = parser.parse()
     
     print(f"✓ Found {len(questionnaire_data['all_qa'])} Q&A pairs")
-    print(f"✓ Found {len(questionnaire_data['persona_qa'])} persona-related Q&A pairs")
+    print(f"✓ Found {questionnaire_data['persona_count']} persona-related Q&A pairs")
     
-    # Generate personas
+    # Generate personas, streaming the response so each persona row is written as it arrives
     print(f"\n🤖 Generating personas using Gemini 2.5 Flash...")
+    output = output_path(input_csv)
+    print(f"\n💾 Exporting to CSV: {output}")
     try:
-        generator = GeminiPersonaGenerator(api_key=args.api_key)
-        personas = generator.generate_personas(questionnaire_data)
-        
-        if not personas:
+        if args.per_type:
+            personas = generator.generate_personas_concurrent(questionnaire_data)
+        else:
+            personas = generator.stream_personas(questionnaire_data)
+        exporter = PersonaCSVExporter(output)
+        if not exporter.export(personas, questionnaire_data['client_info']):
             print("Error: No personas generated. Please check the API response.")
             sys.exit(1)
-        
-        print(f"✓ Generated {len(personas)} persona(s)")
-        
     except Exception as e:
         print(f"Error generating personas: {e}")
         sys.exit(1)
     
-    # Export to CSV
-    print(f"\n💾 Exporting to CSV: {args.output}")
-    exporter = PersonaCSVExporter(args.output)
-    exporter.export(personas, questionnaire_data['client_info'])
-    
-    print(f"\n✅ Complete! Personas saved to: {args.output}")
+    print_token_usage(generator)
+    print(f"\n✅ Complete! Personas saved to: {output}")
 
 
 if __name__ == '__main__':